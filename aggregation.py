@@ -6,17 +6,29 @@ Created on Mon May 26 10:02:36 2025
 """
 
 import os
+import re
+import csv
+import codecs
 import numpy as np
 import pandas as pd
+import openpyxl
 import win32com.client
 import pythoncom
 from pathlib import Path
-from typing import List, Dict, Set, Callable
+from typing import List, Dict, Callable, Optional, Iterator, NamedTuple, Tuple
+from collections import OrderedDict
+from itertools import chain, islice
+from zipfile import ZipFile, BadZipFile
+from xml.etree import ElementTree
 from pyexcelerate import Workbook
 
-from utils import read_config, fix_excel_filename
+from utils import get_settings, fix_excel_filename, SheetStats, Settings
 from data_text import (NAME_OUTPUT_FILE,
+                       NAME_SUMMARY_SHEET,
                        TEXT_CONCAT_PROCESS,
+                       TEXT_DEDUP_PROCESS,
+                       TEXT_ERR_DEDUP_KEYS,
+                       TEXT_SUMMARY_PROCESS,
                        TEXT_LOAD_FILE_XLS,
                        TEXT_OPEN_FILE_XLS,
                        TEXT_GENERATING_LIST_SHEETS,
@@ -33,6 +45,10 @@ class NoSelectSheetsError(Exception):
 class LargeDataError(Exception):
     """Custom exception for if len(df) > 1_000_000"""
 
+class DedupKeyError(Exception):
+    """Custom exception for dedup key columns missing in data."""
+    pass
+
 def is_excel_file_open(filepath: str) -> bool:
     """Проверяем, существует ли файл"""
     if not os.path.exists(filepath):
@@ -56,157 +72,872 @@ def is_excel_file_open(filepath: str) -> bool:
         pythoncom.CoUninitialize()
 
 
-def get_excel_files(folder_path: Path) -> List[Path]:
+EXCEL_EXTENSIONS = ('.xls', '.xlsx', '.xlsm', '.xlsb', '.odf')
+TEXT_EXTENSIONS = ('.csv', '.tsv', '.txt')
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + TEXT_EXTENSIONS
+
+
+def get_excel_files(folder_path: Path, exclude: Optional[Path] = None) -> List[Path]:
     """
-    Получить список Excel файлов в указанной папке.
-    Исключает временные файлы и файл с именем 'consolidated.xlsx'.
+    Получить список Excel файлов (а также выгрузок .csv/.tsv/.txt) в указанной папке.
+    Исключает временные файлы, файл с именем 'consolidated.xlsx' и файл exclude
+    (сводный файл, сохраняемый в эту же папку под другим именем).
     """
-    excel_extensions = ('.xls', '.xlsx', '.xlsm', '.xlsb', '.odf')
+    excluded = os.path.normcase(os.path.abspath(exclude)) if exclude is not None else None
     files = [
         f for f in folder_path.iterdir()
         if f.is_file()
-        and f.suffix.lower() in excel_extensions
+        and f.suffix.lower() in SUPPORTED_EXTENSIONS
         and not f.name.startswith('~')
         and f.name.lower() != 'consolidated.xlsx'
+        and (excluded is None or os.path.normcase(os.path.abspath(f)) != excluded)
     ]
     if not files:
         raise NoExcelFilesError("В указанной папке нет файлов Excel.")
     return files
 
 
-def get_sheet_names(file_path: Path) -> List[str]:
+# Кэш имен листов: (путь, время изменения, размер) -> имена листов.
+# Имена, прочитанные при поиске листов, не читаются заново при агрегации.
+# Размер ограничен: в режиме наблюдения каждое изменение файла дает новый ключ.
+SHEET_NAMES_CACHE_SIZE = 1024
+_sheet_names_cache: "OrderedDict[tuple, List[str]]" = OrderedDict()
+
+
+def get_sheet_names(file_path: Path, settings: Optional[Settings] = None) -> List[str]:
     """
     Получить список имен листов в Excel файле.
+    Текстовые выгрузки (.csv/.tsv/.txt) считаются книгами с одним листом
+    reader_settings.csv_sheet_name.
+    Результат кэшируется до изменения файла.
     """
+    if file_path.suffix.lower() in TEXT_EXTENSIONS:
+        return [(settings or get_settings()).csv_sheet_name]
+    stat = file_path.stat()
+    cache_key = (str(file_path), stat.st_mtime_ns, stat.st_size)
+    if cache_key in _sheet_names_cache:
+        _sheet_names_cache.move_to_end(cache_key)
+        return _sheet_names_cache[cache_key]
     try:
         xls = pd.ExcelFile(file_path)
-        return xls.sheet_names
     except KeyError:
         fix_excel_filename(file_path)
         xls = pd.ExcelFile(file_path)
-        return xls.sheet_names
+    _sheet_names_cache[cache_key] = xls.sheet_names
+    if len(_sheet_names_cache) > SHEET_NAMES_CACHE_SIZE:
+        _sheet_names_cache.popitem(last=False)
+    return xls.sheet_names
+
+def count_text_lines(file_path: Path) -> int:
+    """Считает строки текстового файла по переводам строк, не разбирая значения."""
+    lines = 0
+    last_byte = b'\n'
+    with open(file_path, 'rb') as text_file:
+        while chunk := text_file.read(1_048_576):
+            lines += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+    return lines + (last_byte != b'\n')
+
+
+def detect_text_encoding(sample: bytes) -> str:
+    """
+    Определяет кодировку выгрузки по началу файла: utf-8 (с BOM или без) либо cp1251,
+    в которой 1С обычно сохраняет текстовые файлы.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # final=False: последний символ выборки может быть обрезан посередине
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1251'
+
+
+def detect_text_delimiter(text: str, suffix: str) -> str:
+    """Определяет разделитель колонок по началу файла (csv.Sniffer)."""
+    try:
+        return csv.Sniffer().sniff(text, delimiters=';\t,|').delimiter
+    except csv.Error:
+        return '\t' if suffix == '.tsv' else ';'
+
+
+def _parse_text_cells(column: pd.Series, decimal: str) -> pd.Series:
+    """
+    Преобразует в числа ячейки колонки текстовой выгрузки, записанные числом (как ячейки листа Excel).
+    Каждая ячейка разбирается отдельно, поэтому значение не зависит от соседних строк и блоков:
+    колонка только из чисел становится числовой, иначе остается object с числами и текстом
+    (например, шапка в первой строке при general_header = 0).
+    Текстом остаются значения с ведущим нулем ('05' — код счета 1С) и, если дробная часть
+    отделяется запятой, значения с точкой ('60.01').
+    """
+    column = column.astype(object)
+    text = column.str.strip()
+    if decimal != '.':
+        text = text.where(~text.str.contains('.', regex=False, na=False)).str.replace(decimal, '.', regex=False)
+    text = text.where(~text.str.match(r'[-+]?0\d', na=False))
+    numbers = pd.to_numeric(text, errors='coerce')
+    is_number = numbers.notna()
+    if is_number[column.notna()].all():
+        return numbers
+    result = column.copy()
+    if is_number.any():
+        result[is_number] = pd.to_numeric(text[is_number]).astype(object)
+    return result
+
+
+def read_text_file(file_path: Path, settings: Settings) -> Iterator[pd.DataFrame]:
+    """
+    Читает текстовую выгрузку (.csv/.tsv/.txt) как единственный лист книги.
+    Кодировка (utf-8/cp1251) и разделитель определяются по первым 64 Кб файла.
+    Если разделитель не запятая, дробная часть чисел отделяется запятой (как в выгрузках 1С).
+    Значения читаются как текст и преобразуются в числа по ячейкам (см. _parse_text_cells).
+    
+    Настройки шапки применяются так же, как для Excel: при общей шапке первая строка
+    (или найденная поиском шапки) задает названия колонок, при поиске шапки
+    итоговые строки в конце файла отбрасываются. Пустые поля после последней колонки
+    шапки (разделитель в конце строк данных) игнорируются; если в строках данных
+    есть значения за пределами шапки, возбуждается ValueError (файл будет пропущен).
+    Без settings.chunk_rows файл читается целиком многопоточным движком pyarrow
+    (если он установлен), иначе — блоками по chunk_rows строк.
+    """
+    with open(file_path, 'rb') as text_file:
+        sample = text_file.read(65_536)
+    encoding = detect_text_encoding(sample)
+    sample_lines = sample.decode(encoding, errors='ignore').splitlines()
+    if len(sample) == 65_536:
+        # Последняя строка выборки может быть обрезана
+        sample_lines = sample_lines[:-1]
+    sample_lines = sample_lines or [""]
+    delimiter = detect_text_delimiter("\n".join(sample_lines), file_path.suffix.lower())
+    sample_rows = list(csv.reader(sample_lines, delimiter=delimiter))
+    # Строки преамбулы короче строк данных, поэтому число колонок берем по всей выборке
+    width = max(len(row) for row in sample_rows) or 1
+    
+    options = {'sep': delimiter, 'encoding': encoding, 'header': None, 'names': list(range(width)), 'dtype': str}
+    # Выгрузки 1С с разделителем ";" или табуляцией используют десятичную запятую
+    decimal = ',' if delimiter != ',' else '.'
+    trim_markers = None
+    if settings.general_header == 1:
+        options['header'] = 0
+        del options['names']
+        if settings.header_auto_detect:
+            head = pd.read_csv(file_path, sep=delimiter, encoding=encoding, header=None,
+                               names=list(range(width)), nrows=settings.header_scan_rows,
+                               skip_blank_lines=False)
+            options['skiprows'] = find_header_index(list(head.itertuples(index=False)),
+                                                    settings.header_key_column)
+            trim_markers = list(settings.header_total_markers)
+        # Без index_col=False pandas делает первую колонку индексом, если строки данных
+        # длиннее шапки, и значения сдвигаются на колонку влево
+        options['index_col'] = False
+        header_index = options.get('skiprows', 0)
+        if header_index < len(sample_rows):
+            header_width = len(sample_rows[header_index])
+            if any(any(value.strip() for value in row[header_width:])
+                   for row in sample_rows[header_index + 1:]):
+                raise ValueError(f"В файле {file_path.name} строки данных содержат больше колонок, чем шапка.")
+    
+    if settings.chunk_rows:
+        frames = pd.read_csv(file_path, chunksize=settings.chunk_rows, **options)
+    else:
+        try:
+            frames = [pd.read_csv(file_path, engine='pyarrow', **options)]
+        except (ImportError, ValueError):
+            frames = [pd.read_csv(file_path, **options)]
+    if trim_markers is not None:
+        frames = _trim_last_frame(frames, trim_markers)
+    for frame in frames:
+        for name in frame.columns:
+            frame[name] = _parse_text_cells(frame[name], decimal)
+        yield frame
+
+
+def _trim_last_frame(frames: Iterator[pd.DataFrame], total_markers: List[str]) -> Iterator[pd.DataFrame]:
+    """Отбрасывает хвост файла (см. trim_total_rows): он может быть только в последнем блоке."""
+    previous = None
+    for frame in frames:
+        if previous is not None:
+            yield previous
+        previous = frame
+    if previous is not None:
+        yield trim_total_rows(previous, total_markers)
+
+
+def find_header_index(rows: List[tuple], key_column: str = "") -> int:
+    """
+    Определяет номер строки шапки среди первых строк листа rows.
+    
+    - Если задан key_column — шапкой считается первая строка, в которой есть ячейка
+      с таким названием (без учета регистра и пробелов по краям).
+    - Иначе (или если колонки key_column нет среди rows) шапкой считается первая строка
+      с максимальным числом заполненных ячеек, все значения которой являются текстом
+      (типичная шапка отчетов 1С после преамбулы).
+    Если шапку найти не удалось, возвращается 0 (первая строка листа).
+    """
+    if not rows:
+        return 0
+    
+    if key_column:
+        key = key_column.strip().casefold()
+        for row_index, row in enumerate(rows):
+            if any(isinstance(value, str) and value.strip().casefold() == key for value in row):
+                return row_index
+    
+    filled_rows = [[value for value in row if not pd.isna(value)] for row in rows]
+    max_filled = max(len(values) for values in filled_rows)
+    for row_index, values in enumerate(filled_rows):
+        if len(values) == max_filled and all(isinstance(value, str) for value in values):
+            return row_index
+    return 0
+
+
+def locate_header_row(excel_file: pd.ExcelFile,
+                      sheet_name: str,
+                      key_column: str = "",
+                      scan_rows: int = 30) -> int:
+    """
+    Определяет номер строки шапки на листе по первым scan_rows строкам (см. find_header_index).
+    Читается только ограниченное число строк, данные листа целиком не загружаются.
+    """
+    sample = excel_file.parse(sheet_name, header=None, nrows=scan_rows)
+    return find_header_index(list(sample.itertuples(index=False)), key_column)
+
+
+def is_trailing_row(row: tuple, markers: tuple) -> bool:
+    """
+    Проверяет, относится ли строка к хвосту листа: пустая строка или итоговая строка,
+    первая заполненная ячейка которой начинается с одного из markers (в нижнем регистре).
+    """
+    values = [value for value in row if not pd.isna(value)]
+    if not values:
+        return True
+    first_value = values[0]
+    return bool(markers) and isinstance(first_value, str) and first_value.strip().casefold().startswith(markers)
+
+
+def trim_total_rows(df: pd.DataFrame, total_markers: List[str]) -> pd.DataFrame:
+    """
+    Отбрасывает хвост листа: пустые строки и итоговые строки ("Итого", "Всего" и т.п.),
+    расположенные после области данных.
+    """
+    markers = tuple(marker.casefold() for marker in total_markers)
+    end = len(df)
+    while end > 0 and is_trailing_row(tuple(df.iloc[end - 1]), markers):
+        end -= 1
+    return df.iloc[:end] if end < len(df) else df
+
+
+def _header_names(header: tuple, width: int) -> List:
+    """
+    Названия колонок по строке шапки (как в pandas): пустые ячейки -> 'Unnamed: N',
+    повторяющиеся названия получают суффиксы '.1', '.2' и т.д.
+    """
+    names = []
+    seen: Dict[str, int] = {}
+    for position in range(width):
+        value = header[position] if position < len(header) else None
+        name = f'Unnamed: {position}' if value is None or pd.isna(value) else value
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _build_chunk(block: List[tuple],
+                 header: Optional[tuple]) -> pd.DataFrame:
+    """
+    Собирает DataFrame блока строк листа.
+    Колонки 'Имя файла' и 'Имя листа' не добавляются: они заполняются при сборке
+    сводной таблицы (assemble_blocks).
+    Типы колонок выводятся по значениям ячеек (как в pd.read_excel): колонка только из чисел
+    становится числовой, из дат — датой, иначе остается object. Значения ячеек от границ
+    блоков не зависят, а разные числовые типы блоков приводятся к общему в assemble_blocks.
+    """
+    width = max(len(header or ()), max(len(row) for row in block))
+    values = np.empty((len(block), width), dtype=object)
+    for row_index, row in enumerate(block):
+        values[row_index, :len(row)] = row
+    
+    names = _header_names(header, width) if header is not None else list(range(width))
+    data = {}
+    for position, name in enumerate(names):
+        data[name] = values[:, position]
+    return pd.DataFrame(data, copy=False).infer_objects()
+
+
+def iter_sheet_chunks(worksheet,
+                      settings: Settings) -> Iterator[pd.DataFrame]:
+    """
+    Построчно читает лист .xlsx/.xlsm (книга openpyxl, открытая в режиме read_only)
+    и возвращает блоки по settings.chunk_rows строк. Лист целиком в память не загружается.
+    
+    Шапка и хвост листа обрабатываются так же, как в read_sheets:
+    при общей шапке первая строка (или найденная поиском шапки) задает названия колонок,
+    пустые строки в конце листа (и итоговые строки при поиске шапки) отбрасываются.
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = None
+    markers: tuple = ()
+    if settings.general_header == 1:
+        if settings.header_auto_detect:
+            head = list(islice(rows, settings.header_scan_rows))
+            header_index = find_header_index(head, settings.header_key_column)
+            header = head[header_index] if head else ()
+            rows = chain(head[header_index + 1:], rows)
+            markers = tuple(marker.casefold() for marker in settings.header_total_markers)
+        else:
+            header = next(rows, ())
+    
+    block: List[tuple] = []
+    # Строки, похожие на хвост листа, придерживаем, пока не встретится строка с данными
+    pending: List[tuple] = []
+    for row in rows:
+        if is_trailing_row(row, markers):
+            pending.append(row)
+            continue
+        if pending:
+            block.extend(pending)
+            pending = []
+        block.append(row)
+        if len(block) >= settings.chunk_rows:
+            yield _build_chunk(block, header)
+            block = []
+    if block:
+        yield _build_chunk(block, header)
+
+
+def iter_workbook_chunks(file_excel: Path,
+                         sheets_to_read: List[str],
+                         settings: Settings) -> Iterator[Tuple[str, pd.DataFrame]]:
+    """
+    Потоково читает выбранные листы файла .xlsx/.xlsm блоками (см. iter_sheet_chunks).
+    Книга открывается один раз на файл: общие строки (sharedStrings) разбираются
+    один раз, а не для каждого листа.
+    """
+    workbook = openpyxl.load_workbook(file_excel, read_only=True, data_only=True)
+    try:
+        for sheet in sheets_to_read:
+            for chunk in iter_sheet_chunks(workbook[sheet], settings):
+                yield sheet, chunk
+    finally:
+        workbook.close()
+
+
+def read_sheets(file_excel: Path,
+                sheets_to_read: List[str],
+                settings: Settings) -> Dict[str, pd.DataFrame]:
+    """
+    Читает выбранные листы файла с учетом настройки шапки.
+    При включенном поиске шапки (settings.header_auto_detect == 1) для каждого листа
+    определяется строка шапки, преамбула над ней пропускается, а итоговые строки
+    в конце листа отбрасываются.
+    """
+    header_param = 0 if settings.general_header == 1 else None  # 0 для шапки, None для номеров
+    if header_param is None or not settings.header_auto_detect:
+        return pd.read_excel(file_excel, sheet_name=sheets_to_read, header=header_param)
+    
+    df_dict: Dict[str, pd.DataFrame] = {}
+    with pd.ExcelFile(file_excel) as xls:
+        for sheet in sheets_to_read:
+            header_row = locate_header_row(xls, sheet, settings.header_key_column, settings.header_scan_rows)
+            df = xls.parse(sheet, header=header_row)
+            df_dict[sheet] = trim_total_rows(df, list(settings.header_total_markers))
+    return df_dict
+
+
+class SheetBlock(NamedTuple):
+    """Прочитанные данные листа (или блока строк листа) вместе с их происхождением."""
+    file_path: Path
+    sheet_name: str
+    frame: pd.DataFrame
+
+
+def assemble_blocks(blocks: List[SheetBlock]) -> pd.DataFrame:
+    """
+    Собирает сводную таблицу из блоков листов за один проход.
+    
+    Для каждой колонки заранее выделяется массив на все строки, данные блоков копируются
+    в него один раз. Колонки 'Имя файла' и 'Имя листа' заполняются срезами.
+    Это заменяет df.insert по каждому листу и файлу и двойной pd.concat, каждый из которых
+    копирует данные заново.
+    
+    Колонки объединяются по названию в порядке первого появления (как в pd.concat).
+    Если колонка есть во всех блоках с одним и тем же типом numpy, тип сохраняется;
+    если типы разные, но все числовые (например, int64 и float64 в блоках одного листа),
+    используется общий числовой тип. Иначе колонка собирается как object с NaN
+    на месте отсутствующих значений.
+    """
+    lengths = [len(block.frame) for block in blocks]
+    offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+    total = int(offsets[-1])
+    
+    column_dtypes: Dict[object, list] = {}
+    for block in blocks:
+        for name, dtype in block.frame.dtypes.items():
+            column_dtypes.setdefault(name, []).append(dtype)
+    
+    file_column = np.empty(total, dtype=object)
+    sheet_column = np.empty(total, dtype=object)
+    data = {'Имя файла': file_column, 'Имя листа': sheet_column}
+    for name, dtypes in column_dtypes.items():
+        first_dtype = dtypes[0]
+        if (len(dtypes) == len(blocks) and isinstance(first_dtype, np.dtype)
+                and all(dtype == first_dtype for dtype in dtypes)):
+            data[name] = np.empty(total, dtype=first_dtype)
+        elif (len(dtypes) == len(blocks)
+                and all(isinstance(dtype, np.dtype) and dtype.kind in 'iuf' for dtype in dtypes)):
+            data[name] = np.empty(total, dtype=np.result_type(*set(dtypes)))
+        else:
+            column = np.empty(total, dtype=object)
+            column.fill(np.nan)
+            data[name] = column
+    
+    for block, start, end in zip(blocks, offsets[:-1], offsets[1:]):
+        file_column[start:end] = block.file_path.name
+        sheet_column[start:end] = block.sheet_name
+        for name, values in block.frame.items():
+            data[name][start:end] = values.to_numpy()
+    
+    return pd.DataFrame(data, copy=False)
+
+
+def deduplicate_rows(result: pd.DataFrame,
+                     file_ranks: np.ndarray,
+                     key_columns: List[str]) -> pd.DataFrame:
+    """
+    Удаляет дубли строк между файлами по правилу "побеждает последний файл".
+    
+    result     — сводная таблица (с колонками 'Имя файла' и 'Имя листа');
+    file_ranks — ранг файла для каждой строки result (0 — самый свежий файл по дате изменения);
+    key_columns — названия колонок ключа. Если список пуст, ключом является вся строка данных.
+    
+    Для каждого ключа остаются строки только того файла, у которого наименьший ранг.
+    Строки внутри одного файла не схлопываются. Ключи сравниваются по хэшу,
+    поэтому сортировка всей таблицы не требуется.
+    Если каких-то колонок ключа нет в сводной таблице, возбуждается DedupKeyError
+    (иначе все строки получили бы одинаковый ключ и остался бы только самый свежий файл).
+    """
+    data_columns = [column for column in result.columns if column not in ('Имя файла', 'Имя листа')]
+    if key_columns:
+        columns_by_name = {str(column): column for column in data_columns}
+        missing_keys = [key for key in key_columns if key not in columns_by_name]
+        if missing_keys:
+            raise DedupKeyError(TEXT_ERR_DEDUP_KEYS.format(columns=", ".join(missing_keys)))
+        subset = result[[columns_by_name[key] for key in key_columns]]
+    else:
+        subset = result[data_columns]
+    
+    hashes = pd.util.hash_pandas_object(subset, index=False).to_numpy()
+    winner_ranks = pd.Series(file_ranks).groupby(hashes, sort=False).transform('min').to_numpy()
+    return result[file_ranks == winner_ranks].reset_index(drop=True)
+
+
+SUMMARY_FUNCTIONS = {'sum': 'сумма', 'count': 'количество', 'min': 'мин', 'max': 'макс'}
+SUMMARY_ROWS_COLUMN = 'Количество строк'
+SUMMARY_COMPACT_THRESHOLD = 64  # после стольких частичных итогов они сворачиваются в один
+
+
+def partial_summary(df: pd.DataFrame,
+                    group_columns: List[str],
+                    value_columns: List[str],
+                    constants: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Считает частичные итоги (сумма, количество, мин, макс) по колонкам value_columns
+    в разрезе group_columns для данных одного файла (листа, блока строк).
+    Колонки сопоставляются по строковому названию, отсутствующие в файле колонки
+    считаются пустыми. Нечисловые значения в value_columns игнорируются.
+    constants — значения колонок, которых нет в df, но которые постоянны для него
+    (например, 'Имя файла' и 'Имя листа' блока).
+    Результат объединяется с итогами других файлов функцией combine_summaries.
+    """
+    columns_by_name = {str(column): column for column in df.columns}
+    constants = constants or {}
+    frame = pd.DataFrame(index=df.index)
+    for name in group_columns:
+        if name in columns_by_name:
+            frame[name] = df[columns_by_name[name]]
+        else:
+            frame[name] = constants.get(name, np.nan)
+    for name in value_columns:
+        values = df[columns_by_name[name]] if name in columns_by_name else np.nan
+        frame[name] = pd.to_numeric(values, errors='coerce')
+    
+    grouped = frame.groupby(group_columns, sort=False, dropna=False)
+    partial = pd.DataFrame({SUMMARY_ROWS_COLUMN: grouped.size()})
+    for name in value_columns:
+        for function, label in SUMMARY_FUNCTIONS.items():
+            partial[f'{name} ({label})'] = grouped[name].agg(function)
+    return partial
+
+
+def compact_summaries(partials: List[pd.DataFrame],
+                      group_columns: List[str],
+                      value_columns: List[str]) -> pd.DataFrame:
+    """
+    Объединяет частичные итоги в один частичный итог того же формата:
+    суммы и количества складываются, для мин/макс берется минимум/максимум.
+    """
+    combine_functions = {SUMMARY_ROWS_COLUMN: 'sum'}
+    for name in value_columns:
+        for function, label in SUMMARY_FUNCTIONS.items():
+            combine_functions[f'{name} ({label})'] = 'sum' if function == 'count' else function
+    
+    levels = list(range(len(group_columns)))
+    return (pd.concat(partials)
+            .groupby(level=levels, sort=False, dropna=False)
+            .agg(combine_functions))
+
+
+def combine_summaries(partials: List[pd.DataFrame],
+                      group_columns: List[str],
+                      value_columns: List[str]) -> pd.DataFrame:
+    """Объединяет частичные итоги файлов в общую сводную таблицу."""
+    return compact_summaries(partials, group_columns, value_columns).reset_index()
+
+
+def frame_to_rows(df: pd.DataFrame) -> List[list]:
+    """Конвертирует DataFrame в список списков (шапка + данные) для записи через pyexcelerate."""
+    df = df.replace([np.nan, '#ЧИСЛО', 'nan'], None)
+    return [df.columns.tolist()] + df.values.tolist()
+
+
+_DIMENSION_PATTERN = re.compile(rb'<(?:\w+:)?dimension\s+ref="[A-Z]*\d*(?::[A-Z]*(\d+))?"')
+_SHEET_DATA_PATTERN = re.compile(rb'<(?:\w+:)?sheetData')
+
+
+def _read_dimension_rows(excel_container: ZipFile, part_name: str) -> Optional[int]:
+    """
+    Читает из начала xml листа элемент <dimension ref="A1:F1234"/> и возвращает номер
+    последней строки (1234). Данные ячеек не читаются: поиск прекращается на <sheetData>.
+    Если элемента нет, возвращает None.
+    """
+    head = b''
+    with excel_container.open(part_name) as sheet_xml:
+        while len(head) < 1_048_576:
+            chunk = sheet_xml.read(4096)
+            if not chunk:
+                break
+            head += chunk
+            match = _DIMENSION_PATTERN.search(head)
+            if match:
+                return int(match.group(1)) if match.group(1) else 1
+            if _SHEET_DATA_PATTERN.search(head):
+                break
+    return None
+
+
+def get_sheet_dimensions(file_path: Path) -> Dict[str, Optional[int]]:
+    """
+    Получить словарь "имя листа -> оценка количества строк" по метаданным книги.
+    Для .xlsx/.xlsm количество строк берется из элемента dimension каждого листа,
+    для текстовых выгрузок — по числу переводов строк,
+    для остальных форматов (и при ошибках разбора) оценка равна None.
+    """
+    if file_path.suffix.lower() in TEXT_EXTENSIONS:
+        return {get_settings().csv_sheet_name: count_text_lines(file_path)}
+    if file_path.suffix.lower() not in ('.xlsx', '.xlsm'):
+        return {name: None for name in get_sheet_names(file_path)}
+    
+    try:
+        with ZipFile(file_path) as excel_container:
+            # 1С может записывать части книги с другим регистром в именах
+            parts = {name.lower(): name for name in excel_container.namelist()}
+            workbook = ElementTree.fromstring(excel_container.read(parts['xl/workbook.xml']))
+            rels = ElementTree.fromstring(excel_container.read(parts['xl/_rels/workbook.xml.rels']))
+            targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+            
+            dimensions: Dict[str, Optional[int]] = {}
+            for sheet in workbook.iter():
+                if not sheet.tag.endswith('}sheet'):
+                    continue
+                relation_id = next((value for key, value in sheet.attrib.items() if key.endswith('}id')), None)
+                target = targets.get(relation_id, '')
+                part_name = target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+                part_name = parts.get(part_name.lower())
+                dimensions[sheet.get('name')] = (_read_dimension_rows(excel_container, part_name)
+                                                 if part_name else None)
+            return dimensions
+    except (KeyError, ElementTree.ParseError, BadZipFile):
+        return {name: None for name in get_sheet_names(file_path)}
+
 
 def get_unique_sheet_names(file_paths: List[Path],
-                           on_status: Callable[[str], None]) -> List[str]:
+                           on_status: Callable[[str], None],
+                           on_progress: Optional[Callable[[int, int], None]] = None
+                           ) -> Dict[str, SheetStats]:
     """
-    Получить отсортированный список уникальных листов из всех файлов.
-    Обновляет прогресс бар во время обработки.
+    Получить отсортированный словарь уникальных листов из всех файлов со статистикой:
+    в каких файлах встречается лист и оценка суммарного количества строк.
+    Оценка строится по метаданным листов (dimension), данные ячеек не загружаются.
+    Обновляет прогресс бар во время обработки (on_progress(обработано, всего)).
     """
     on_status(TEXT_GENERATING_LIST_SHEETS)
-    unique_sheets: Set[str] = set()
+    sheet_stats: Dict[str, SheetStats] = {}
     for index, file_path in enumerate(file_paths):
-        if not file_path.exists() or file_path.suffix.lower() not in ['.xlsx', '.xls', '.xlsm', '.xlsb', '.odf']:
+        if on_progress is not None:
+            on_progress(index, len(file_paths))
+        if not file_path.exists() or file_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
             continue  # Пропускаем несуществующие или неподдерживаемые файлы
         try:
-            workbook_sheetnames = get_sheet_names(file_path)
-            unique_sheets.update(workbook_sheetnames)
+            dimensions = get_sheet_dimensions(file_path)
         except Exception:
             # Логирование или обработка ошибок чтения листов можно добавить здесь
-            pass
-    list_unique_sheets = sorted(unique_sheets, key=str.casefold)
-    return list_unique_sheets
+            continue
+        for sheet_name, rows in dimensions.items():
+            sheet_stats.setdefault(sheet_name, SheetStats()).add_file(file_path.name, rows)
+    if on_progress is not None:
+        on_progress(len(file_paths), len(file_paths))
+    return {name: sheet_stats[name] for name in sorted(sheet_stats, key=str.casefold)}
+
+
+class AggregationPlan(NamedTuple):
+    """Что нужно собирать при чтении файлов при текущих настройках."""
+    keep_detail: bool  # хранить детальные строки (пишутся в файл или нужны для удаления дублей)
+    summary_incremental: bool  # считать итоги по каждому файлу сразу после чтения
+    group_columns: List[str]
+    value_columns: List[str]
+    
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AggregationPlan":
+        dedup_enabled = bool(settings.dedup_enabled)
+        return cls(keep_detail=settings.summary_mode != "summary" or dedup_enabled,
+                   summary_incremental=settings.summary_mode in ("summary", "both") and not dedup_enabled,
+                   group_columns=list(settings.summary_group_columns) or ['Имя листа'],
+                   value_columns=list(settings.summary_value_columns))
+
+
+class FileResult(NamedTuple):
+    """
+    Результат чтения одного файла.
+    missing_sheets — None, если прочитан хотя бы один лист, иначе список отсутствующих листов
+    (файл попадет в отчет о пропущенных файлах).
+    """
+    blocks: List[SheetBlock]
+    partials: List[pd.DataFrame]
+    missing_sheets: Optional[List[str]]
+
+
+class FileResultCollector:
+    """
+    Накапливает результаты чтения файлов (FileResult) для save_consolidated:
+    блоки листов, частичные итоги (сворачиваются, когда их больше SUMMARY_COMPACT_THRESHOLD)
+    и словарь пропущенных файлов (имя файла -> отсутствующие листы).
+    """
+    
+    def __init__(self, plan: AggregationPlan):
+        self.plan = plan
+        self.blocks: List[SheetBlock] = []
+        self.summary_partials: List[pd.DataFrame] = []
+        self.missing_files: Dict[str, List[str]] = {}
+    
+    def add(self, file_path: Path, file_result: FileResult) -> None:
+        if file_result.missing_sheets is not None:
+            self.missing_files[file_path.name] = file_result.missing_sheets
+            return
+        self.blocks.extend(file_result.blocks)
+        self.summary_partials.extend(file_result.partials)
+        if len(self.summary_partials) > SUMMARY_COMPACT_THRESHOLD:
+            self.summary_partials = [compact_summaries(self.summary_partials,
+                                                       self.plan.group_columns,
+                                                       self.plan.value_columns)]
+    
+    @property
+    def has_data(self) -> bool:
+        """Есть ли что сохранять в сводный файл."""
+        return bool(self.blocks or self.summary_partials)
+
+
+def read_file(file_excel: Path,
+              sheet_name_list: List[str],
+              settings: Settings) -> FileResult:
+    """
+    Читает выбранные листы одного файла и возвращает блоки листов и/или частичные итоги
+    в соответствии с AggregationPlan.
+    Ошибки чтения не пробрасываются: файл считается пропущенным со всеми листами.
+    """
+    plan = AggregationPlan.from_settings(settings)
+    try:
+        # Получаем доступные листы
+        lists_current_file = get_sheet_names(file_excel, settings)
+        available_sheets = set(lists_current_file)
+        # Фильтруем и сортируем листы (игнорируем регистр)
+        sheets_to_read = sorted([sheet for sheet in sheet_name_list if sheet in available_sheets], key=str.lower)
+        missing_sheets = [sheet for sheet in sheet_name_list if sheet not in available_sheets]
+        
+        if not sheets_to_read:
+            return FileResult([], [], missing_sheets)
+        
+        if file_excel.suffix.lower() in TEXT_EXTENSIONS:
+            # Текстовая выгрузка — книга с единственным листом
+            sheet_frames = ((sheets_to_read[0], frame) for frame in read_text_file(file_excel, settings))
+        elif settings.chunk_rows and file_excel.suffix.lower() in ('.xlsx', '.xlsm'):
+            # Потоковое чтение блоками: в памяти одновременно только один блок листа
+            # (и накопленные детальные строки, если они нужны)
+            sheet_frames = iter_workbook_chunks(file_excel, sheets_to_read, settings)
+        else:
+            # Читаем листы с учётом настройки шапки
+            sheet_frames = read_sheets(file_excel, sheets_to_read, settings).items()
+        
+        file_blocks: List[SheetBlock] = []
+        file_partials: List[pd.DataFrame] = []
+        for sheet, frame in sheet_frames:
+            if plan.summary_incremental:
+                constants = {'Имя файла': file_excel.name, 'Имя листа': sheet}
+                file_partials.append(partial_summary(frame, plan.group_columns, plan.value_columns, constants))
+                if len(file_partials) > SUMMARY_COMPACT_THRESHOLD:
+                    file_partials = [compact_summaries(file_partials, plan.group_columns, plan.value_columns)]
+            if plan.keep_detail:
+                file_blocks.append(SheetBlock(file_excel, sheet, frame))
+        return FileResult(file_blocks, file_partials, None)
+    
+    except (FileNotFoundError, PermissionError, ValueError):
+        # Файл не найден, нет доступа или ошибка чтения Excel (например, повреждённый файл или неверный лист)
+        # Предполагаем, что все листы отсутствуют
+        return FileResult([], [], sheet_name_list.copy())
+    except Exception:
+        # Другие неожиданные ошибки
+        # Предполагаем, что все листы отсутствуют
+        return FileResult([], [], sheet_name_list.copy())
+
+
+def save_consolidated(blocks: List[SheetBlock],
+                      summary_partials: List[pd.DataFrame],
+                      settings: Settings,
+                      on_status: Callable[[str], None],
+                      output_path: str = NAME_OUTPUT_FILE,
+                      open_result: bool = True) -> None:
+    """
+    Собирает сводную таблицу из блоков листов (удаляя дубли и считая итоги по настройкам)
+    и сохраняет ее в output_path. При open_result файл открывается после сохранения.
+    """
+    plan = AggregationPlan.from_settings(settings)
+    summary_partials = list(summary_partials)
+    try:
+        sheets_data: List[tuple] = []
+        if blocks:
+            on_status(TEXT_CONCAT_PROCESS)
+            result = assemble_blocks(blocks)
+            
+            if settings.dedup_enabled:
+                on_status(TEXT_DEDUP_PROCESS)
+                # Ранжируем файлы по дате изменения: 0 — самый свежий
+                block_files = dict.fromkeys(block.file_path for block in blocks)
+                files_by_mtime = sorted(block_files, key=lambda file: file.stat().st_mtime, reverse=True)
+                rank_by_file = {file: rank for rank, file in enumerate(files_by_mtime)}
+                file_ranks = np.repeat([rank_by_file[block.file_path] for block in blocks],
+                                       [len(block.frame) for block in blocks])
+                result = deduplicate_rows(result, file_ranks, list(settings.dedup_key_columns))
+                if settings.summary_mode in ("summary", "both"):
+                    summary_partials.append(partial_summary(result, plan.group_columns, plan.value_columns))
+            
+            if settings.summary_mode != "summary":
+                if len(result) > 1_000_000:
+                    raise LargeDataError("В сводном файле будет более млн. строк., что превышает лимит листа Excel.")
+                sheets_data.append(('sheet1', result))
+        
+        if summary_partials:
+            on_status(TEXT_SUMMARY_PROCESS)
+            summary = combine_summaries(summary_partials, plan.group_columns, plan.value_columns)
+            if len(summary) > 1_000_000:
+                raise LargeDataError("В сводном файле будет более млн. строк., что превышает лимит листа Excel.")
+            sheets_data.append((NAME_SUMMARY_SHEET, summary))
+        
+        on_status(TEXT_LOAD_FILE_XLS)
+        
+        # Конвертируем DataFrame в список списков
+        wb = Workbook()
+        for sheet_name, frame in sheets_data:
+            wb.new_sheet(sheet_name, data=frame_to_rows(frame))
+        wb.save(output_path)
+        
+        # result.to_excel(output_path, index=False)
+        
+        if open_result:
+            on_status(TEXT_OPEN_FILE_XLS)
+            if os.name == 'nt':
+                os.startfile(os.path.abspath(output_path))
+    except LargeDataError:
+        raise LargeDataError("В сводном файле будет более млн. строк., что превышает лимит листа Excel.")
+    except DedupKeyError:
+        raise
+    except PermissionError:
+        raise PermissionError(f"Ошибка доступа к файлу {output_path}")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Файл {output_path} не найден.")
+    except OSError:
+        raise OSError("Ошибка: не найдено приложение для открытия файла.")
+    except Exception as e:
+        raise Exception(f"Неизвестная ошибка при сохранении: {e}")
 
 
 def aggregating_data_from_excel_files(excel_files: List[Path],
                                       sheet_name_list: List[str],
-                                      on_status: Callable[[str], None]
+                                      on_status: Callable[[str], None],
+                                      on_progress: Optional[Callable[[int, int], None]] = None,
+                                      settings: Optional[Settings] = None,
+                                      output_path: str = NAME_OUTPUT_FILE,
+                                      open_result: bool = True
                                       ) -> Dict[str, List[str]]:
     """
     Агрегирует данные из указанных листов Excel-файлов в один файл.
     Возвращает словарь файлов, которые не удалось обработать, где ключ - имя файла, а значения - список отсутствующих листов этого файла.
-    Обновляет виджеты Textual (прогресс бар и notify) во время обработки.
+    Обновляет виджеты Textual (прогресс бар и строку статуса) во время обработки:
+    on_status — текстовые сообщения об этапах, on_progress(обработано, всего) — счетчик файлов.
+    Если on_progress не передан, прогресс сообщается через on_status каждые 10% файлов.
+    Если settings не переданы, используются настройки из config.json (get_settings).
+    Сводный файл сохраняется в output_path и при open_result открывается.
     
     Добавлена поддержка общей шапки на основе config.json:
     - general_header: 0 — без шапки (данные с номерами колонок).
     - general_header: 1 — с шапкой (первая строка файла — заголовки).
+    
+    При general_header: 1 и header_settings.auto_detect: 1 строка шапки ищется на каждом
+    листе автоматически (по header_settings.key_column или эвристике), преамбула
+    отчета и итоговые строки в конце листа пропускаются.
+    
+    При dedup_settings.enabled: 1 дубли строк между файлами удаляются по ключу
+    dedup_settings.key_columns (или по всей строке), побеждает самый свежий файл.
+    
+    summary_settings.mode задает содержимое сводного файла:
+    - detail — только детальные строки (по умолчанию);
+    - summary — только лист с итогами (сумма/количество/мин/макс по value_columns
+      в разрезе group_columns), детальные строки в памяти не накапливаются;
+    - both — детальные строки и лист с итогами.
+    
+    При reader_settings.chunk_rows > 0 листы .xlsx/.xlsm читаются потоково блоками
+    по chunk_rows строк (iter_workbook_chunks), в режиме итогов объем памяти на файл
+    не зависит от размера листа.
     """
     if not excel_files:
         return {}  # Нет файлов для обработки
     on_status(TEXT_GENERATING_CONSOLIDATED_FILE)
     
-    # Читаем конфиг для настройки шапки
-    config = read_config()
-    general_header = config.get("general_settings", {}).get("general_header", 0)
-    header_param = 0 if general_header == 1 else None  # 0 для шапки, None для номеров
-    
-    dict_df: Dict[Path, pd.DataFrame] = {}
-    missing_files: Dict[str, List[str]] = {}
+    if settings is None:
+        settings = get_settings()
+    collector = FileResultCollector(AggregationPlan.from_settings(settings))
     
     number_of_files = len(excel_files)
     checkpoints = [int(number_of_files * i / 10) for i in range(1, 11)]
     for index, file_excel in enumerate(excel_files):
-        try:
-            # Получаем доступные листы
-            lists_current_file = get_sheet_names(file_excel)
-            available_sheets = set(lists_current_file)
-            # Фильтруем и сортируем листы (игнорируем регистр)
-            sheets_to_read = sorted([sheet for sheet in sheet_name_list if sheet in available_sheets], key=str.lower)
-            missing_sheets = [sheet for sheet in sheet_name_list if sheet not in available_sheets]
-            
-            if not sheets_to_read:
-                missing_files[file_excel.name] = missing_sheets
-                continue
-            
-            # Читаем листы с учётом настройки шапки
-            df_dict = pd.read_excel(file_excel, sheet_name=sheets_to_read, header=header_param)
-            
-            # Добавляем колонку с именем листа в каждый DataFrame
-            for key, df in df_dict.items():
-                df.insert(0, 'Имя листа', key)
-            
-            # Объединяем все листы текущего файла
-            df = pd.concat(df_dict.values(), ignore_index=True)
-            
-            # Добавляем колонку с именем файла
-            df.insert(0, 'Имя файла', file_excel.name)
-            
-            dict_df[file_excel] = df
-            
-            if (index + 1) in checkpoints:
-                percent_complete = ((index + 1) * 100) // number_of_files
-                on_status(f"Обработано {percent_complete}% файлов ({index + 1} из {number_of_files})")
-            
-        except (FileNotFoundError, PermissionError, ValueError):
-            # Файл не найден, нет доступа или ошибка чтения Excel (например, повреждённый файл или неверный лист)
-            # Предполагаем, что все листы отсутствуют
-            missing_files[file_excel.name] = sheet_name_list.copy()
-        except Exception:
-            # Другие неожиданные ошибки
-            # Предполагаем, что все листы отсутствуют
-            missing_files[file_excel.name] = sheet_name_list.copy()
+        if on_progress is not None:
+            on_progress(index, number_of_files)
+        
+        collector.add(file_excel, read_file(file_excel, sheet_name_list, settings))
+        
+        if on_progress is None and (index + 1) in checkpoints:
+            percent_complete = ((index + 1) * 100) // number_of_files
+            on_status(f"Обработано {percent_complete}% файлов ({index + 1} из {number_of_files})")
   
+    if on_progress is not None:
+        on_progress(number_of_files, number_of_files)
+    
     # Если есть данные, сохраняем и открываем
-    if dict_df:
-        try:
-            on_status(TEXT_CONCAT_PROCESS)
-            result = pd.concat(dict_df.values(), ignore_index=True)
-            
-            if len(result) > 1_000_000:
-                raise LargeDataError("В сводном файле будет более млн. строк., что превышает лимит листа Excel.")
-            
-            on_status(TEXT_LOAD_FILE_XLS)
-            
-            # Конвертируем DataFrame в список списков
-            result = result.replace([np.nan, '#ЧИСЛО', 'nan'], None)
-            data = [result.columns.tolist()] + result.values.tolist()
-            wb = Workbook()
-            wb.new_sheet('sheet1', data=data)
-            wb.save(NAME_OUTPUT_FILE)
-            
-            # result.to_excel(NAME_OUTPUT_FILE, index=False)
-            
-            on_status(TEXT_OPEN_FILE_XLS)
-            if os.name == 'nt':
-                os.startfile(os.path.abspath(NAME_OUTPUT_FILE))
-        except LargeDataError:
-            raise LargeDataError("В сводном файле будет более млн. строк., что превышает лимит листа Excel.")
-        except PermissionError:
-            raise PermissionError(f"Ошибка доступа к файлу {NAME_OUTPUT_FILE}")
-        except FileNotFoundError:
-            raise FileNotFoundError(f"Файл {NAME_OUTPUT_FILE} не найден.")
-        except OSError:
-            raise OSError("Ошибка: не найдено приложение для открытия файла.")
-        except Exception as e:
-            raise Exception(f"Неизвестная ошибка при сохранении: {e}")
-    
-    return missing_files
+    if collector.has_data:
+        save_consolidated(collector.blocks, collector.summary_partials, settings, on_status,
+                          output_path, open_result)
+    
+    return collector.missing_files
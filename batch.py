@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная агрегация нескольких папок по файлу заданий в общем пуле процессов.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+from aggregation import (get_excel_files,
+                         read_file,
+                         save_consolidated,
+                         AggregationPlan,
+                         FileResult,
+                         FileResultCollector)
+from utils import get_settings, Settings
+from data_text import (NAME_OUTPUT_FILE,
+                       TEXT_BATCH_JOB_DONE,
+                       TEXT_BATCH_JOB_FAILED,
+                       TEXT_ERR_NO_PROCESSED_FILES)
+
+
+class BatchJobError(Exception):
+    """Custom exception for invalid batch job file."""
+    pass
+
+
+class BatchJob(NamedTuple):
+    """Задание пакетной агрегации: папка, листы и сводный файл со своими настройками."""
+    name: str
+    folder: Path
+    sheets: List[str]
+    output: str
+    settings: Settings
+
+
+class JobReport(NamedTuple):
+    """
+    Итог выполнения задания.
+    seconds — время выполнения задания: от начала чтения его первого файла в рабочем процессе
+    до сохранения сводного файла (задания выполняются одновременно в общем пуле,
+    поэтому время от запуска пакета для всех заданий было бы почти одинаковым).
+    """
+    name: str
+    files: int
+    missing_files: Dict[str, List[str]]
+    seconds: float
+    error: Optional[str] = None
+
+
+def load_batch_jobs(jobs_path: Path, settings: Optional[Settings] = None) -> List[BatchJob]:
+    """
+    Читает задания из JSON или TOML файла вида:
+
+        {"jobs": [{"name": "Филиал 1", "folder": "D:/Отчеты/Ф1", "sheets": ["ОСВ"],
+                   "header": 1, "output": "D:/Свод/Ф1.xlsx"}, ...]}
+
+    name, header и output необязательны. header переопределяет general_header из config.json,
+    остальные настройки берутся из config.json. Относительные пути считаются от папки файла заданий.
+    """
+    if settings is None:
+        settings = get_settings()
+    try:
+        if jobs_path.suffix.lower() == '.toml':
+            if tomllib is None:
+                raise BatchJobError("Для файлов заданий TOML требуется Python 3.11 или новее.")
+            with open(jobs_path, 'rb') as file:
+                definition = tomllib.load(file)
+        else:
+            with open(jobs_path, 'r', encoding='utf-8') as file:
+                definition = json.load(file)
+    except (OSError, ValueError) as e:
+        raise BatchJobError(f"Не удалось прочитать файл заданий {jobs_path}: {e}")
+
+    if not isinstance(definition, dict) or not isinstance(definition.get("jobs", []), list):
+        raise BatchJobError(f"Файл {jobs_path} должен содержать объект со списком заданий jobs.")
+    
+    base_folder = jobs_path.parent
+    jobs: List[BatchJob] = []
+    for index, job in enumerate(definition.get("jobs", []), 1):
+        _validate_job(job, index)
+        job_settings = settings
+        if "header" in job:
+            if job["header"] not in (0, 1):
+                raise BatchJobError(f"В задании №{index} header должен быть 0 или 1.")
+            job_settings = replace(settings, general_header=int(job["header"]))
+        folder = base_folder / job["folder"]
+        output = base_folder / job["output"] if "output" in job else folder / NAME_OUTPUT_FILE
+        jobs.append(BatchJob(name=job.get("name", folder.name),
+                             folder=folder,
+                             sheets=list(job["sheets"]),
+                             output=str(output),
+                             settings=job_settings))
+    if not jobs:
+        raise BatchJobError(f"В файле {jobs_path} нет заданий.")
+    return jobs
+
+
+def _validate_job(job: object, index: int) -> None:
+    """Проверяет типы полей задания №index, при ошибке возбуждает BatchJobError."""
+    if not isinstance(job, dict):
+        raise BatchJobError(f"Задание №{index} должно быть объектом с полями folder и sheets.")
+    if not isinstance(job.get("folder"), str) or not job["folder"]:
+        raise BatchJobError(f"В задании №{index} folder должен быть непустой строкой.")
+    sheets = job.get("sheets")
+    if not isinstance(sheets, list) or not sheets or not all(isinstance(sheet, str) and sheet for sheet in sheets):
+        raise BatchJobError(f"В задании №{index} sheets должен быть непустым списком названий листов.")
+    for field in ("name", "output"):
+        if field in job and (not isinstance(job[field], str) or not job[field]):
+            raise BatchJobError(f"В задании №{index} {field} должен быть непустой строкой.")
+
+
+def run_batch(jobs: List[BatchJob],
+              on_status: Callable[[str], None],
+              workers: Optional[int] = None) -> List[JobReport]:
+    """
+    Выполняет задания в общем пуле процессов.
+
+    Файлы всех заданий отправляются в пул вместе, поэтому все ядра заняты до конца пакета,
+    а не простаивают на последних файлах каждого задания. Рабочие процессы не перезапускаются
+    между заданиями (импорты pandas/openpyxl выполняются один раз). Сводный файл задания
+    собирается и сохраняется в основном процессе, как только прочитаны все его файлы.
+    """
+    reports: Dict[int, JobReport] = {}
+    job_files: Dict[int, List[Path]] = {}
+    job_results: Dict[int, List[Optional[FileResult]]] = {}
+    for job_index, job in enumerate(jobs):
+        try:
+            job_files[job_index] = get_excel_files(job.folder, exclude=Path(job.output))
+            job_results[job_index] = [None] * len(job_files[job_index])
+        except Exception as e:
+            reports[job_index] = JobReport(job.name, 0, {}, 0.0, str(e))
+            on_status(TEXT_BATCH_JOB_FAILED.format(name=job.name, text_err=e))
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = {}
+        for job_index, files in job_files.items():
+            job = jobs[job_index]
+            for file_index, file_path in enumerate(files):
+                future = executor.submit(_read_file_timed, file_path, job.sheets, job.settings)
+                futures[future] = (job_index, file_index)
+        remaining = {job_index: len(files) for job_index, files in job_files.items()}
+        # Время начала чтения первого файла задания (time.time сопоставимо между процессами)
+        job_started: Dict[int, float] = {}
+
+        for job_index in [job_index for job_index, count in remaining.items() if count == 0]:
+            reports[job_index] = _finish_job(jobs[job_index], [], [], time.time(), on_status)
+
+        for future in as_completed(futures):
+            job_index, file_index = futures[future]
+            try:
+                file_result, file_started = future.result()
+            except Exception:
+                # Ошибка передачи результата из рабочего процесса: файл считается пропущенным
+                file_result, file_started = FileResult([], [], jobs[job_index].sheets.copy()), time.time()
+            job_results[job_index][file_index] = file_result
+            job_started[job_index] = min(job_started.get(job_index, file_started), file_started)
+            remaining[job_index] -= 1
+            if remaining[job_index] == 0:
+                reports[job_index] = _finish_job(jobs[job_index], job_files[job_index],
+                                                 job_results.pop(job_index), job_started[job_index], on_status)
+
+    return [reports[job_index] for job_index in range(len(jobs))]
+
+
+def _read_file_timed(file_path: Path,
+                     sheet_name_list: List[str],
+                     settings: Settings) -> Tuple[FileResult, float]:
+    """read_file в рабочем процессе; дополнительно возвращает время начала чтения (time.time)."""
+    started = time.time()
+    return read_file(file_path, sheet_name_list, settings), started
+
+
+def _finish_job(job: BatchJob,
+                files: List[Path],
+                results: List[FileResult],
+                started: float,
+                on_status: Callable[[str], None]) -> JobReport:
+    """
+    Сохраняет сводный файл задания по прочитанным файлам и возвращает итог задания.
+    started — время начала чтения первого файла задания (time.time).
+    """
+    collector = FileResultCollector(AggregationPlan.from_settings(job.settings))
+    for file_path, file_result in zip(files, results):
+        collector.add(file_path, file_result)
+
+    error = None
+    if files and len(collector.missing_files) == len(files):
+        error = TEXT_ERR_NO_PROCESSED_FILES
+    try:
+        if collector.has_data:
+            save_consolidated(collector.blocks, collector.summary_partials, job.settings, lambda status: None,
+                              job.output, open_result=False)
+    except Exception as e:
+        error = str(e)
+
+    seconds = time.time() - started
+    if error is None:
+        on_status(TEXT_BATCH_JOB_DONE.format(name=job.name, files=len(files),
+                                             missing=len(collector.missing_files), seconds=seconds))
+    else:
+        on_status(TEXT_BATCH_JOB_FAILED.format(name=job.name, text_err=error))
+    return JobReport(job.name, len(files), collector.missing_files, seconds, error)
+
+
+def format_batch_report(reports: List[JobReport]) -> str:
+    """Таблица с итогами заданий для вывода в консоль."""
+    lines = [f"{'Задание':<30}{'Файлов':>8}{'Пропущено':>11}{'Время, с':>10}  Статус"]
+    for report in reports:
+        status = "ошибка: " + report.error if report.error else "готово"
+        lines.append(f"{report.name[:30]:<30}{report.files:>8}{len(report.missing_files):>11}"
+                     f"{report.seconds:>10.1f}  {status}")
+    return "\n".join(lines)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение сборки сводной таблицы:
+- прежняя схема: df.insert имени листа, pd.concat листов файла, df.insert имени файла, общий pd.concat;
+- assemble_blocks: сборка блоков листов за один проход в заранее выделенные массивы.
+
+Запуск: python benchmark_assembly.py [число файлов] [строк на лист]
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from aggregation import SheetBlock, assemble_blocks
+
+SHEETS_PER_FILE = 2
+COLUMNS = 10
+
+
+def make_input(number_of_files: int, rows_per_sheet: int) -> List[Tuple[Path, Dict[str, pd.DataFrame]]]:
+    """Синтетические данные: для каждого файла словарь листов, как после pd.read_excel."""
+    rng = np.random.default_rng(0)
+    files = []
+    for file_index in range(number_of_files):
+        sheets = {}
+        for sheet_index in range(SHEETS_PER_FILE):
+            data = {f'Сумма {column}': rng.random(rows_per_sheet) for column in range(COLUMNS - 2)}
+            data['Счет'] = rng.integers(1, 100, rows_per_sheet).astype(str).astype(object)
+            data['Контрагент'] = np.full(rows_per_sheet, f'Контрагент {file_index}', dtype=object)
+            sheets[f'Лист{sheet_index + 1}'] = pd.DataFrame(data)
+        files.append((Path(f'Файл {file_index}.xlsx'), sheets))
+    return files
+
+
+def legacy_assembly(files: List[Tuple[Path, Dict[str, pd.DataFrame]]]) -> pd.DataFrame:
+    """Прежняя схема сборки из aggregating_data_from_excel_files."""
+    dict_df = {}
+    for file_path, df_dict in files:
+        for key, df in df_dict.items():
+            df.insert(0, 'Имя листа', key)
+        df = pd.concat(df_dict.values(), ignore_index=True)
+        df.insert(0, 'Имя файла', file_path.name)
+        dict_df[file_path] = df
+    return pd.concat(dict_df.values(), ignore_index=True)
+
+
+def block_assembly(files: List[Tuple[Path, Dict[str, pd.DataFrame]]]) -> pd.DataFrame:
+    """Сборка через SheetBlock и assemble_blocks."""
+    blocks = [SheetBlock(file_path, sheet, frame)
+              for file_path, df_dict in files
+              for sheet, frame in df_dict.items()]
+    return assemble_blocks(blocks)
+
+
+def measure(assembly: Callable, files) -> Tuple[pd.DataFrame, float, int]:
+    """Время сборки (сек) и пиковый объем дополнительно выделенной памяти (байт)."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = assembly(files)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main() -> None:
+    number_of_files = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rows_per_sheet = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    # Прежняя схема изменяет входные DataFrame (df.insert), поэтому каждому способу — свои данные
+    legacy_result, legacy_time, legacy_peak = measure(legacy_assembly, make_input(number_of_files, rows_per_sheet))
+    block_result, block_time, block_peak = measure(block_assembly, make_input(number_of_files, rows_per_sheet))
+
+    pd.testing.assert_frame_equal(legacy_result, block_result)
+
+    result_size = block_result.memory_usage(index=False, deep=False).sum()
+    print(f"Файлов: {number_of_files}, листов в файле: {SHEETS_PER_FILE}, строк в листе: {rows_per_sheet}, "
+          f"строк в результате: {len(block_result)}")
+    print(f"{'Способ':<22}{'Время, с':>10}{'Пик памяти, МБ':>17}{'Пик / результат':>17}")
+    for name, elapsed, peak in (("df.insert + concat", legacy_time, legacy_peak),
+                                ("assemble_blocks", block_time, block_peak)):
+        print(f"{name:<22}{elapsed:>10.2f}{peak / 2**20:>17.1f}{peak / result_size:>17.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,7 @@ NAME_APP = 'ExcelAggregator'
 SUB_TITLE_APP = 'простой аналог PowerQuery из Excel'
 NAME_DATA_FILE = 'data_comparison.xlsx'
 NAME_OUTPUT_FILE = 'consolidated.xlsx'
+NAME_SUMMARY_SHEET = 'Итоги'
 
 TEXT_INTRODUCTION = '''\
 Позволяет быстро собрать данные из множества файлов Excel в одном за три шага:
@@ -25,6 +26,8 @@ TEXT_INTRODUCTION = '''\
 _Данные будут расположены друг под другом 'как есть', без дополнительной обработки. Это удобно, когда данные из разных файлов имеют одинаковую структуру._
 
 _Если таблицы имеют одинаковые заголовки, включите опцию «Общая шапка» в Настройках, чтобы автоматически объединить данные под общими названиями столбцов._
+
+_Текстовые выгрузки .csv/.tsv/.txt обрабатываются вместе с книгами Excel: каждая считается книгой с одним листом «CSV»._
 '''
 
 TEXT_ALL_PROCESSED_FILES = f'{NAME_APP} обработал все файлы Excel в указанной папке.' # использовано
@@ -39,6 +42,10 @@ TEXT_ERR_NO_PROCESSED_FILES = 'Файлы не обработаны. Убеди
 
 TEXT_ERR_LARGE_DATA = 'В сводном файле будет более млн. строк., что превышает лимит листа Excel.' # использовано
 
+TEXT_WARN_LARGE_DATA = 'По оценке в сводном файле будет более млн. строк. Уменьшите выбор листов или включите режим итогов в Настройках.' # использовано
+
+TEXT_WARN_MISSING_FILES = 'Файлов без выбранных листов: {count}. Они будут пропущены (список — F2 в окне выбора листов).' # использовано
+
 TEXT_ERR_PERMISSION = f'Нет доступа к {NAME_OUTPUT_FILE}. Пожалуйста, закройте данный файл.' # использовано
 
 TEXT_ERR_FILE_NOT_FOUND = 'Не найден {NAME_OUTPUT_FILE}. Повторите операцию, нажав 📥 Агрегировать' # использовано
@@ -56,6 +63,12 @@ TEXT_AGGREGATION_PROCESS = 'Собираем данные с выбранных
 
 TEXT_CONCAT_PROCESS = 'Объединяем данные в общий массив...' # использовано
 
+TEXT_DEDUP_PROCESS = 'Удаляем дубли строк, оставляя данные из самых свежих файлов...' # использовано
+
+TEXT_ERR_DEDUP_KEYS = 'Колонки ключа для удаления дублей не найдены в данных: {columns}. Проверьте настройки удаления дублей (F3).' # использовано
+
+TEXT_SUMMARY_PROCESS = 'Объединяем итоги по группам...' # использовано
+
 TEXT_LOAD_FILE_XLS = 'Выгружаем сводные данные в excel файл...' # использовано
 
 TEXT_OPEN_FILE_XLS = f'Открываем {NAME_OUTPUT_FILE}...' # использовано
@@ -64,6 +77,20 @@ TEXT_ERR_NO_SELECT_SHEETS = """Не выбраны листы для обраб
 
 TEXT_SHEETS_READY = 'Список листов сформирован, для их выбора используйте кнопку 📑 Выбрать листы' # использовано
 
+TEXT_WATCH_STARTED = 'Наблюдение за папкой {folder} включено: сводный файл будет обновляться при изменении файлов.' # использовано
+
+TEXT_WATCH_UPDATED = 'Сводный файл обновлен в {time}: добавлено файлов {added}, изменено {changed}, удалено {removed}.' # использовано
+
+TEXT_WATCH_NO_DATA = 'В {time} в папке нет данных выбранных листов: сводный файл не создан или удален как устаревший (добавлено файлов {added}, изменено {changed}, удалено {removed}).' # использовано
+
+TEXT_WATCH_ERROR = 'Не удалось обновить сводный файл: {text_err}. Повторная попытка при следующей проверке папки.' # использовано
+
+TEXT_WATCH_STOPPED = 'Наблюдение за папкой выключено.' # использовано
+
+TEXT_BATCH_JOB_DONE = 'Задание «{name}» выполнено за {seconds:.1f} с: файлов {files}, пропущено {missing}.' # использовано
+
+TEXT_BATCH_JOB_FAILED = 'Задание «{name}» не выполнено: {text_err}' # использовано
+
 
 
 
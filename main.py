@@ -5,6 +5,10 @@ Created on Mon May 26 09:16:02 2025
 @author: a.karabedyan
 """
 
+import argparse
+import multiprocessing
+import sys
+import threading
 from typing import List, Literal
 from pathlib import Path
 
@@ -12,18 +16,22 @@ from textual import work
 from textual.app import App, ComposeResult
 from textual.reactive import reactive
 from textual.containers import Horizontal
-from textual.widgets import Header, Footer, LoadingIndicator, Markdown, Button
+from textual.widgets import Header, Footer, LoadingIndicator, Markdown, Button, Static, ProgressBar
 from textual.binding import Binding
 
 from modal_screen import SheetsScreen, SettingsScreen, ReportScreen
 
-from utils import select_folder
+from utils import select_folder, SheetIndex, get_settings, generate_compact_report
+from progress import ProgressBus
+from watch import watch_folder
+from batch import load_batch_jobs, run_batch, format_batch_report, BatchJobError
 
 from aggregation import (get_excel_files,
                          aggregating_data_from_excel_files,
                          NoExcelFilesError,
                          NoSelectSheetsError,
                          LargeDataError,
+                         DedupKeyError,
                          get_unique_sheet_names,
                          is_excel_file_open)
 
@@ -41,12 +49,23 @@ from data_text import (NAME_APP,
                        TEXT_ERR_NO_PROCESSED_FILES,
                        TEXT_ALL_PROCESSED_FILES,
                        TEXT_SHEETS_READY,
-                       TEXT_ERR_LARGE_DATA
+                       TEXT_ERR_LARGE_DATA,
+                       TEXT_WATCH_STOPPED
                        )
 
 
 OperationStatus = Literal["before", "after"]
 
+ERROR_MESSAGES = {
+    NoSelectSheetsError: TEXT_ERR_NO_SELECT_SHEETS,
+    NoExcelFilesError: TEXT_ERR_FILES_EXCEL,
+    PermissionError: TEXT_ERR_PERMISSION,
+    FileNotFoundError: TEXT_ERR_FILE_NOT_FOUND,
+    OSError: TEXT_APP_EXCEL_NOT_FIND,
+    TypeError: TEXT_ERR_FOLDER_NOT_SELECTED,
+    LargeDataError: TEXT_ERR_LARGE_DATA
+}
+
 
 
 class ExcelAggregatorApp(App):
@@ -79,6 +98,15 @@ class ExcelAggregatorApp(App):
         height: auto;
     }
 
+    #status-line {
+        height: auto;
+        padding: 0 1;
+    }
+
+    #progress-bar {
+        padding: 0 1;
+    }
+
 
     ReportScreen {
         align: center middle;
@@ -90,14 +118,17 @@ class ExcelAggregatorApp(App):
         align: center middle;
         }
         #container-sheetsscreen-modal{
-            width: 45; 
-            height: 20;
+            width: 60; 
+            height: 24;
             border: solid $accent;
             background: $surface;
             }
         SelectionList{
             height: 5fr;
             }
+        SelectionList.-large-data{
+            border-subtitle-color: $error;
+            }
         #horizontals-button-settings-modal{
             height: 1fr;
 
@@ -107,7 +138,9 @@ class ExcelAggregatorApp(App):
         }
             #container-settings-modal {
                width: 45; 
-               height: 15;
+               height: 38;
+               max-height: 100%;
+               overflow-y: auto;
                border: solid $accent;
                background: $surface;
                padding: 1;
@@ -130,16 +163,24 @@ class ExcelAggregatorApp(App):
 
     """
 
+    PROGRESS_REFRESH_INTERVAL = 0.2 # период (сек) обновления строки статуса из событий рабочих потоков
+
     BINDINGS = [Binding(key="f3",
                         action="push_screen('settings')",
                         description="Настройки",
-                        key_display="F3")]
+                        key_display="F3"),
+                Binding(key="f4",
+                        action="toggle_watch",
+                        description="Наблюдение",
+                        key_display="F4")]
 
     file_path: Path = reactive(Path.cwd()) # путь к выбранной папке с файлами для обработки
     sheet_names: List[str] = reactive(['НЕ ВЫБРАНЫ']) # список всех листов фалов из выбранной папки
     sheet_selected_names: List[str] = reactive(['НЕ ВЫБРАНЫ']) # список выбранных листов для обработки
+    sheet_index: SheetIndex = None # индекс листов со статистикой (файлы, строки) для окна выбора листов
     names_files_excel: List[Path] = reactive(None) # список путей к файлам выбранной папки
     missing_files: dict[str, list[str]] = reactive({}) # словарь пропущенных из-за несуществующих листов файлов (ключ - файл, значение - список листов)
+    watch_stop_event: threading.Event = None # событие остановки наблюдения за папкой (None - наблюдение выключено)
 
     def compose(self) -> ComposeResult:
         markdown = Markdown(TEXT_INTRODUCTION, classes='introduction')
@@ -152,13 +193,18 @@ class ExcelAggregatorApp(App):
             Button("📥 Агрегировать", id="button_aggregate", variant="primary"),
             id="buttons")
         yield LoadingIndicator()
+        yield Static("", id="status-line")
+        yield ProgressBar(id="progress-bar", show_eta=False)
         yield Footer(show_command_palette = False)
 
     def on_mount(self) -> None:
         self.title = NAME_APP
         self.sub_title = SUB_TITLE_APP
         self.query_one(LoadingIndicator).visible = False
+        self.query_one("#progress-bar", ProgressBar).visible = False
         self.install_screen(SettingsScreen(), name="settings")
+        self.progress_bus = ProgressBus()
+        self.set_interval(self.PROGRESS_REFRESH_INTERVAL, self.drain_progress)
         
     def action_push_screen(self, screen_name: str) -> None:
         """Действие для открытия экрана по имени."""
@@ -176,11 +222,26 @@ class ExcelAggregatorApp(App):
         is_loading = status == "before"
         self.query_one(LoadingIndicator).visible = is_loading
         self.query_one(Footer).display = not is_loading
+        self.query_one("#progress-bar", ProgressBar).visible = is_loading
+        if is_loading:
+            self.query_one("#progress-bar", ProgressBar).update(total=None, progress=0)
+        else:
+            self.drain_progress()
+            self.query_one("#status-line", Static).update("")
         for button in self.query("Button"):
             button.disabled = is_loading
     
-    def update_sheet_names(self, sheet_names):
-        self.sheet_names = sheet_names
+    def drain_progress(self) -> None:
+        """Переносит накопившиеся события прогресса из рабочих потоков в строку статуса и прогресс бар."""
+        for event in self.progress_bus.drain():
+            if event.stage == 'status':
+                self.query_one("#status-line", Static).update(event.message)
+            else:
+                self.query_one("#progress-bar", ProgressBar).update(total=event.total, progress=event.current)
+    
+    def update_sheet_names(self, sheet_index: SheetIndex):
+        self.sheet_index = sheet_index
+        self.sheet_names = sheet_index.names
     
     def on_button_pressed(self, event: Button.Pressed) -> None:
         
@@ -213,17 +274,29 @@ class ExcelAggregatorApp(App):
                 self.updating_interface_status('before')
                 self.action_open_consolidate()
     
+    def action_toggle_watch(self) -> None:
+        """Включает/выключает наблюдение за выбранной папкой с автоматическим обновлением сводного файла."""
+        if self.watch_stop_event is not None:
+            self.watch_stop_event.set()
+            self.watch_stop_event = None
+        elif not self.names_files_excel:
+            self.notify(TEXT_ERR_FOLDER_NOT_SELECTED,
+                        title="Ошибка",
+                        severity='error',
+                        timeout=5)
+        elif self.sheet_selected_names == ['НЕ ВЫБРАНЫ']:
+            self.notify(TEXT_ERR_NO_SELECT_SHEETS,
+                        title="Ошибка",
+                        severity='error',
+                        timeout=5)
+        else:
+            self.watch_stop_event = threading.Event()
+            self.watch_thread(self.watch_stop_event)
+    
     def get_error_message(self, error):
-        error_messages = {
-            NoSelectSheetsError: TEXT_ERR_NO_SELECT_SHEETS,
-            NoExcelFilesError: TEXT_ERR_FILES_EXCEL,
-            PermissionError: TEXT_ERR_PERMISSION,
-            FileNotFoundError: TEXT_ERR_FILE_NOT_FOUND,
-            OSError: TEXT_APP_EXCEL_NOT_FIND,
-            TypeError: TEXT_ERR_FOLDER_NOT_SELECTED,
-            LargeDataError: TEXT_ERR_LARGE_DATA
-        }
-        return error_messages.get(type(error), TEXT_UNKNOW_ERR.format(text_err=error))
+        if isinstance(error, DedupKeyError):
+            return str(error)
+        return ERROR_MESSAGES.get(type(error), TEXT_UNKNOW_ERR.format(text_err=error))
     
     def handle_aggregation_results(self, missing_files):
         if len(missing_files) == len(self.names_files_excel):
@@ -243,17 +316,13 @@ class ExcelAggregatorApp(App):
     
     @work(thread=True)
     def load_files_thread(self) -> None:
-        def status_callback(status: str):
-            self.call_from_thread(self.notify,
-                                  status,
-                                  title="Статус",
-                                  severity="info",
-                                  timeout=5)
         try:
             self.names_files_excel = get_excel_files(self.file_path)
-            sheet_names = get_unique_sheet_names(self.names_files_excel,
-                                                 on_status=status_callback)
-            self.call_from_thread(self.update_sheet_names, sheet_names)
+            sheet_stats = get_unique_sheet_names(self.names_files_excel,
+                                                 on_status=self.progress_bus.status,
+                                                 on_progress=self.progress_bus.progress)
+            sheet_index = SheetIndex(sheet_stats, [file.name for file in self.names_files_excel])
+            self.call_from_thread(self.update_sheet_names, sheet_index)
             self.call_from_thread(self.notify,
                                   TEXT_SHEETS_READY,
                                   title="Статус",
@@ -271,19 +340,14 @@ class ExcelAggregatorApp(App):
         
     @work(thread=True)
     def action_open_consolidate(self) -> None:
-        def status_callback(status: str):
-            self.call_from_thread(self.notify,
-                                  status,
-                                  title="Статус",
-                                  severity="info",
-                                  timeout=5)
         try:
             is_excel_file_open(NAME_OUTPUT_FILE)
             missing_files = aggregating_data_from_excel_files(self.names_files_excel,
                                                               self.sheet_selected_names,
-                                                              on_status=status_callback)
+                                                              on_status=self.progress_bus.status,
+                                                              on_progress=self.progress_bus.progress)
             self.call_from_thread(self.handle_aggregation_results, missing_files)
-        except (NoSelectSheetsError, NoExcelFilesError, PermissionError, FileNotFoundError, OSError, TypeError, LargeDataError) as e:
+        except (NoSelectSheetsError, NoExcelFilesError, PermissionError, FileNotFoundError, OSError, TypeError, LargeDataError, DedupKeyError) as e:
             message_error = self.get_error_message(e)
             self.call_from_thread(self.notify,
                                   message_error,
@@ -299,6 +363,100 @@ class ExcelAggregatorApp(App):
         finally:
             self.call_from_thread(self.updating_interface_status, 'after')
 
+    @work(thread=True, group="watch")
+    def watch_thread(self, stop_event: threading.Event) -> None:
+        try:
+            watch_folder(self.file_path,
+                         list(self.sheet_selected_names),
+                         on_status=self.progress_bus.status,
+                         stop_event=stop_event,
+                         settings=get_settings())
+        except Exception as e:
+            self.call_from_thread(self.notify,
+                                  TEXT_UNKNOW_ERR.format(text_err=e),
+                                  title="Ошибка",
+                                  severity="error",
+                                  timeout=5)
+    
+    def on_unmount(self) -> None:
+        if self.watch_stop_event is not None:
+            self.watch_stop_event.set()
+
+
+def run_batch_headless(args: argparse.Namespace) -> int:
+    """
+    Пакетная агрегация: python main.py --batch ЗАДАНИЯ.json [--workers N].
+    Возвращает код завершения (1, если хотя бы одно задание не выполнено).
+    """
+    try:
+        jobs = load_batch_jobs(Path(args.batch))
+    except BatchJobError as e:
+        print(e, file=sys.stderr)
+        return 1
+    reports = run_batch(jobs, on_status=print, workers=args.workers)
+    print(format_batch_report(reports))
+    return 1 if any(report.error for report in reports) else 0
+
+
+def run_headless(args: argparse.Namespace) -> int:
+    """
+    Агрегация без интерфейса: python main.py --folder ПАПКА --sheets ЛИСТ [ЛИСТ ...] [--watch].
+    Сообщения о ходе работы выводятся в консоль. Возвращает код завершения.
+    """
+    folder_path = Path(args.folder)
+    
+    def print_missing_files(changes, missing_files):
+        if missing_files:
+            print(generate_compact_report(missing_files))
+    
+    try:
+        if args.watch:
+            stop_event = threading.Event()
+            try:
+                watch_folder(folder_path, args.sheets, on_status=print, stop_event=stop_event,
+                             output_path=args.output, on_update=print_missing_files)
+            except KeyboardInterrupt:
+                stop_event.set()
+                print(TEXT_WATCH_STOPPED)
+            return 0
+        
+        excel_files = get_excel_files(folder_path, exclude=Path(args.output))
+        missing_files = aggregating_data_from_excel_files(excel_files, args.sheets, on_status=print,
+                                                          output_path=args.output, open_result=False)
+    except DedupKeyError as e:
+        print(e, file=sys.stderr)
+        return 1
+    except (NoExcelFilesError, PermissionError, FileNotFoundError, OSError, LargeDataError) as e:
+        print(ERROR_MESSAGES.get(type(e), TEXT_UNKNOW_ERR.format(text_err=e)), file=sys.stderr)
+        return 1
+    
+    if len(missing_files) == len(excel_files):
+        print(TEXT_ERR_NO_PROCESSED_FILES, file=sys.stderr)
+        return 1
+    if missing_files:
+        print(generate_compact_report(missing_files))
+    else:
+        print(TEXT_ALL_PROCESSED_FILES)
+    return 0
+
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # рабочие процессы пакетного режима в собранном exe
+    parser = argparse.ArgumentParser(description=f"{NAME_APP} — {SUB_TITLE_APP}")
+    parser.add_argument("--folder", help="папка с файлами для агрегации (запуск без интерфейса)")
+    parser.add_argument("--sheets", nargs="+", help="листы, данные с которых агрегируются")
+    parser.add_argument("--output", default=NAME_OUTPUT_FILE, help=f"сводный файл (по умолчанию {NAME_OUTPUT_FILE})")
+    parser.add_argument("--watch", action="store_true", help="наблюдать за папкой и обновлять сводный файл при изменениях")
+    parser.add_argument("--batch", help="файл заданий (JSON/TOML) для пакетной агрегации нескольких папок")
+    parser.add_argument("--workers", type=int, help="число рабочих процессов пакетного режима (по умолчанию - число ядер)")
+    args = parser.parse_args()
+    
+    if args.batch:
+        sys.exit(run_batch_headless(args))
+    if args.folder:
+        if not args.sheets:
+            parser.error("--sheets обязателен при запуске с --folder")
+        sys.exit(run_headless(args))
+    
     app = ExcelAggregatorApp()
     app.run()
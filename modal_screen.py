@@ -8,12 +8,14 @@ Created on Sun Nov 30 16:15:26 2025
 from textual import on
 from textual.app import ComposeResult
 from textual.containers import Horizontal
-from textual.widgets import Footer, Static, Button, Switch, SelectionList, Markdown
+from textual.widgets import Footer, Static, Button, Switch, SelectionList, Markdown, Input, Select
 from textual.containers import Container
 from textual.screen import ModalScreen
 from textual.binding import Binding
+from rich.text import Text
 
-from utils import update_config, read_config, DEFAULT_CONFIG, generate_compact_report
+from utils import update_config, get_settings, generate_compact_report, SheetStats
+from data_text import TEXT_WARN_LARGE_DATA, TEXT_WARN_MISSING_FILES
 
 class ReportScreen(ModalScreen):
     """
@@ -40,14 +42,22 @@ class ReportScreen(ModalScreen):
 
 class SheetsScreen(ModalScreen):
     """
-    Окно с выбором листов из книг Excel для агрегирования
+    Окно с выбором листов из книг Excel для агрегирования.
+    Листы берутся из предварительно построенного индекса (self.app.sheet_index),
+    список фильтруется по вводу и отображается порциями по SHEETS_PAGE_SIZE.
     """
+    SHEETS_PAGE_SIZE = 200
+    FILTER_DELAY = 0.15
+    
     BINDINGS = [
         Binding(key="backspace", action="deselect", description="Очистить выбор", key_display="backspace"),
+        Binding(key="ctrl+n", action="show_more", description="Показать еще", key_display="ctrl+n"),
+        Binding(key="f2", action="show_report", description="Пропущенные файлы", key_display="F2"),
         Binding(key="escape", action="exit_windows", description="Закрыть", key_display="escape"),
     ]
     def compose(self) -> ComposeResult:
         yield Container(
+        Input(placeholder="Поиск листа", id="input-sheetsscreen-filter"),
         SelectionList(),
         Horizontal(
             Button("Сохранить", variant="success", id="button-sheetsscreen-modal"),
@@ -57,38 +67,95 @@ class SheetsScreen(ModalScreen):
         yield Footer()
         
     def on_mount(self) -> None:
-        self.query_one(Button).disabled = True
-        self.query_one(SelectionList).border_title = "Выберите листы:"
-        self.query_one(SelectionList).clear_options()
-        self.query_one(SelectionList).add_options([(name, name) for name in self.app.sheet_names])
+        self._selected: set = set()
+        self._visible: set = set()
+        self._matches: list = self.app.sheet_index.names
+        self._limit = self.SHEETS_PAGE_SIZE
+        self._filter_timer = None
         
         # Восстановление выбора из предыдущей сессии
-        if hasattr(self.app, 'sheet_selected_names'):
-            # Упрощенная проверка
-            if (self.app.sheet_selected_names and 
-                self.app.sheet_selected_names != ['НЕ ВЫБРАНЫ']):
-                
-                # Восстанавливаем выбранные элементы
-                for name in self.app.sheet_selected_names:
-                    if name in self.app.sheet_names and name != 'НЕ ВЫБРАНЫ':
-                        self.query_one(SelectionList).select(name)
+        if (self.app.sheet_selected_names and
+            self.app.sheet_selected_names != ['НЕ ВЫБРАНЫ']):
+            self._selected = {name for name in self.app.sheet_selected_names
+                              if name in self.app.sheet_index.stats}
+        
+        self.query_one(Button).disabled = not self._selected
+        self.render_options()
+        self.update_estimate()
+    
+    def render_options(self) -> None:
+        """Отображает первые self._limit листов, подходящих под фильтр."""
+        selection_list = self.query_one(SelectionList)
+        sheet_stats = self.app.sheet_index.stats
+        page = self._matches[:self._limit]
+        self._visible = set(page)
+        selection_list.clear_options()
+        selection_list.add_options([(Text(self.sheet_label(name, sheet_stats[name])), name, name in self._selected)
+                                    for name in page])
+        selection_list.border_title = f"Выберите листы ({len(page)} из {len(self._matches)}):"
+    
+    @staticmethod
+    def sheet_label(name: str, stats: SheetStats) -> str:
+        rows = f"~{stats.rows}" if stats.rows_known else f"~{stats.rows}+"
+        return f"{name} — файлов: {len(stats.files)}, строк: {rows}"
+    
+    def update_estimate(self) -> None:
+        """Показывает оценку размера сводного файла для выбранных листов."""
+        rows, rows_known = self.app.sheet_index.estimate_rows(list(self._selected))
+        selection_list = self.query_one(SelectionList)
+        selection_list.border_subtitle = f"Строк в сводном файле: ~{rows}{'' if rows_known else '+'}"
+        selection_list.set_class(rows > 1_000_000, "-large-data")
+    
+    @on(Input.Changed, "#input-sheetsscreen-filter")
+    def handle_filter_changed(self, event: Input.Changed) -> None:
+        # Откладываем фильтрацию, пока пользователь печатает
+        if self._filter_timer is not None:
+            self._filter_timer.stop()
+        self._filter_timer = self.set_timer(self.FILTER_DELAY, lambda: self.apply_filter(event.value))
+    
+    def apply_filter(self, text: str) -> None:
+        self._matches = self.app.sheet_index.filter(text)
+        self._limit = self.SHEETS_PAGE_SIZE
+        self.render_options()
+    
+    def action_show_more(self) -> None:
+        if self._limit < len(self._matches):
+            self._limit += self.SHEETS_PAGE_SIZE
+            self.render_options()
     
     def on_button_pressed(self, event: Button.Pressed):
         """Обрабатывает нажатие кнопки "Сохранить"."""
         if event.button.id == "button-sheetsscreen-modal":
-            self.app.sheet_selected_names = self.query_one(SelectionList).selected
+            self.app.sheet_selected_names = sorted(self._selected, key=str.casefold)
+            rows, _ = self.app.sheet_index.estimate_rows(self.app.sheet_selected_names)
+            if rows > 1_000_000:
+                self.app.notify(TEXT_WARN_LARGE_DATA, title="Предупреждение", severity='warning', timeout=5)
+            missing_files = self.app.sheet_index.predict_missing_files(self.app.sheet_selected_names)
+            if missing_files:
+                self.app.notify(TEXT_WARN_MISSING_FILES.format(count=len(missing_files)),
+                                title="Предупреждение", severity='warning', timeout=5)
             self.dismiss()
     
+    def action_show_report(self) -> None:
+        """Показывает файлы, которые будут пропущены при текущем выборе листов."""
+        self.app.missing_files = self.app.sheet_index.predict_missing_files(
+            sorted(self._selected, key=str.casefold))
+        self.app.push_screen(ReportScreen())
+    
     @on(SelectionList.SelectedChanged)
     def handle_select_sheet(self):
+        # Выбор скрытых фильтром листов сохраняется
         selected = self.query_one(SelectionList).selected
-        self.query_one(Button).disabled = False if selected else True
+        self._selected = (self._selected - self._visible) | set(selected)
+        self.query_one(Button).disabled = False if self._selected else True
+        self.update_estimate()
     
     def action_deselect(self) -> None:
+        self._selected.clear()
         self.query_one(SelectionList).deselect_all()
+        self.update_estimate()
     
     def action_exit_windows(self) -> None:
-        self.query_one(SelectionList).deselect_all()
         self.app.pop_screen()
         
         
@@ -99,9 +166,15 @@ class SettingsScreen(ModalScreen):
     """
     
     def compose(self) -> ComposeResult:
-        config = read_config()
-        general_options = config.get("general_settings", DEFAULT_CONFIG.get("general_settings", {}))
-        general_header_value = bool(general_options.get("general_header", 0))
+        settings = get_settings()
+        general_header_value = bool(settings.general_header)
+        auto_detect_value = bool(settings.header_auto_detect)
+        key_column_value = settings.header_key_column
+        dedup_enabled_value = bool(settings.dedup_enabled)
+        dedup_keys_value = "; ".join(settings.dedup_key_columns)
+        summary_mode_value = settings.summary_mode
+        group_columns_value = "; ".join(settings.summary_group_columns)
+        value_columns_value = "; ".join(settings.summary_value_columns)
         
         yield Container(
             Horizontal(
@@ -109,6 +182,34 @@ class SettingsScreen(ModalScreen):
                 Switch(value=general_header_value, id='switch-general-header', classes="switchs-settings-modal"),
                 id='horizontal-general-header-settings-modal'
                 ),
+            Horizontal(
+                Static("Поиск шапки:", classes="statics-settings-modal"),
+                Switch(value=auto_detect_value, id='switch-header-auto-detect', classes="switchs-settings-modal"),
+                id='horizontal-header-auto-detect-settings-modal'
+                ),
+            Input(value=key_column_value,
+                  placeholder="Ключевой столбец шапки",
+                  id='input-header-key-column'),
+            Horizontal(
+                Static("Удалять дубли:", classes="statics-settings-modal"),
+                Switch(value=dedup_enabled_value, id='switch-dedup', classes="switchs-settings-modal"),
+                id='horizontal-dedup-settings-modal'
+                ),
+            Input(value=dedup_keys_value,
+                  placeholder="Ключевые столбцы через ;",
+                  id='input-dedup-key-columns'),
+            Select([("Только детальные строки", "detail"),
+                    ("Только итоги", "summary"),
+                    ("Строки и итоги", "both")],
+                   value=summary_mode_value,
+                   allow_blank=False,
+                   id='select-summary-mode'),
+            Input(value=group_columns_value,
+                  placeholder="Группировать по столбцам через ;",
+                  id='input-summary-group-columns'),
+            Input(value=value_columns_value,
+                  placeholder="Суммировать столбцы через ;",
+                  id='input-summary-value-columns'),
             Horizontal(
                 Button("Сохранить", variant="success", id="button-settings-modal"),
                 id="horizontals-button-settings-modal"),
@@ -117,15 +218,47 @@ class SettingsScreen(ModalScreen):
     
     def on_mount(self) -> None:
         self.query_one('#horizontal-general-header-settings-modal').tooltip = 'Автоматически объединить данные под общими названиями столбцов'
+        self.query_one('#horizontal-header-auto-detect-settings-modal').tooltip = 'Найти строку шапки на каждом листе, пропустив преамбулу отчета и итоговые строки (работает вместе с общей шапкой)'
+        self.query_one('#input-header-key-column').tooltip = 'Название столбца, по которому ищется строка шапки. Если не указано, шапка определяется автоматически'
+        self.query_one('#horizontal-dedup-settings-modal').tooltip = 'Удалить повторяющиеся строки из разных файлов, оставив строки самого свежего файла'
+        self.query_one('#input-dedup-key-columns').tooltip = 'Столбцы, по которым определяются дубли. Если не указаны, сравнивается вся строка'
+        self.query_one('#select-summary-mode').tooltip = 'Что выгружать в сводный файл: детальные строки, лист с итогами по группам или и то, и другое'
+        self.query_one('#input-summary-group-columns').tooltip = 'Столбцы группировки для листа итогов. Если не указаны, итоги считаются по листам'
+        self.query_one('#input-summary-value-columns').tooltip = 'Столбцы, по которым считаются сумма, количество, минимум и максимум'
 
     
+    def _split_columns(self, input_id: str) -> list:
+        """Разбивает введенный через ; список столбцов."""
+        value = self.query_one(input_id, Input).value
+        return [column.strip() for column in value.split(';') if column.strip()]
+    
     def on_button_pressed(self, event: Button.Pressed):
         """Обрабатывает нажатие кнопки "Сохранить"."""
         if event.button.id == "button-settings-modal":
             general_header_val = int(self.query_one('#switch-general-header', Switch).value)
+            auto_detect_val = int(self.query_one('#switch-header-auto-detect', Switch).value)
+            key_column_val = self.query_one('#input-header-key-column', Input).value.strip()
+            dedup_enabled_val = int(self.query_one('#switch-dedup', Switch).value)
+            dedup_keys_val = self._split_columns('#input-dedup-key-columns')
+            summary_mode_val = self.query_one('#select-summary-mode', Select).value
+            group_columns_val = self._split_columns('#input-summary-group-columns')
+            value_columns_val = self._split_columns('#input-summary-value-columns')
             updates = {
                         "general_settings": {
                             "general_header": general_header_val,
+                                            },
+                        "header_settings": {
+                            "auto_detect": auto_detect_val,
+                            "key_column": key_column_val,
+                                            },
+                        "dedup_settings": {
+                            "enabled": dedup_enabled_val,
+                            "key_columns": dedup_keys_val,
+                                            },
+                        "summary_settings": {
+                            "mode": summary_mode_val,
+                            "group_columns": group_columns_val,
+                            "value_columns": value_columns_val,
                                             }
                       }
 
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Канал событий прогресса обработки между рабочими потоками и интерфейсом.
+"""
+
+from dataclasses import dataclass
+from queue import SimpleQueue, Empty
+from typing import Dict, List
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """
+    Событие прогресса обработки.
+    stage   — этап ('status' — текстовое сообщение, 'files' — обработка файлов и т.п.);
+    message — текст для строки статуса;
+    current, total — счетчики для прогресс бара (0, если не применимо).
+    """
+    stage: str
+    message: str = ""
+    current: int = 0
+    total: int = 0
+
+
+class ProgressBus:
+    """
+    Канал событий прогресса между рабочими потоками и интерфейсом.
+
+    Рабочие потоки публикуют события без ожидания интерфейса (SimpleQueue.put не блокирует),
+    интерфейс периодически забирает накопившиеся события методом drain.
+    За один вызов drain от каждого этапа остается только последнее событие,
+    поэтому частые обновления по файлам и листам не перегружают экран.
+    """
+
+    def __init__(self):
+        self._queue: SimpleQueue = SimpleQueue()
+
+    def publish(self, event: ProgressEvent) -> None:
+        self._queue.put_nowait(event)
+
+    def status(self, message: str) -> None:
+        """Публикует текстовое сообщение (совместимо с колбэком on_status)."""
+        self.publish(ProgressEvent('status', message))
+
+    def progress(self, current: int, total: int, stage: str = 'files') -> None:
+        """Публикует счетчик прогресса (совместимо с колбэком on_progress)."""
+        self.publish(ProgressEvent(stage, current=current, total=total))
+
+    def drain(self) -> List[ProgressEvent]:
+        """Забирает все накопившиеся события, оставляя последнее событие каждого этапа."""
+        latest: Dict[str, ProgressEvent] = {}
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except Empty:
+                break
+            latest.pop(event.stage, None)
+            latest[event.stage] = event
+        return list(latest.values())
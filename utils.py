@@ -8,20 +8,32 @@ Created on Fri Nov 28 15:12:12 2025
 import json, os, shutil, tempfile
 import tkinter as tk
 from tkinter import filedialog
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, field
 from pathlib import Path
 from zipfile import ZipFile
 
 
-# Глобальная переменная для кэширования конфигурации
-_config_cache: Dict[str, Any] = {}
 CONFIG_FILE_PATH = "config.json"
 
 
 # Значения по умолчанию для config.json
 # Используем значения из config.json, который вы предоставили в первом сообщении
 DEFAULT_CONFIG = {
-    "general_settings": {"general_header": 0}}
+    "general_settings": {"general_header": 0},
+    "header_settings": {"auto_detect": 0,
+                        "key_column": "",
+                        "scan_rows": 30,
+                        "total_markers": ["Итого", "Всего"]},
+    "dedup_settings": {"enabled": 0,
+                       "key_columns": []},
+    "summary_settings": {"mode": "detail",
+                         "group_columns": [],
+                         "value_columns": []},
+    "reader_settings": {"chunk_rows": 0,
+                        "csv_sheet_name": "CSV"},
+    "watch_settings": {"interval": 2.0,
+                       "debounce": 3.0}}
 
 def write_default_config(config_path: str = None):
     """Создает файл config.json со значениями по умолчанию."""
@@ -108,17 +120,171 @@ def update_config(updates, config_path: str = None):
         print(f"Ошибка при обновлении конфигурации: {e}")
         return False
 
-def load_config(file_path: str = CONFIG_FILE_PATH) -> Dict[str, Any]:
-    global _config_cache
-    if not _config_cache:
-        _config_cache = read_config(file_path)
-    return _config_cache
-
-
 # Добавляем функцию для очистки кэша, чтобы можно было перечитать конфиг
 def clear_config_cache():
-    global _config_cache
-    _config_cache = {}
+    _settings_cache.clear()
+
+
+# Схема config.json: (раздел, ключ) -> (поле Settings, допустимый тип, проверка значения)
+SETTINGS_SCHEMA = {
+    ("general_settings", "general_header"): ("general_header", int, lambda value: value in (0, 1)),
+    ("header_settings", "auto_detect"): ("header_auto_detect", int, lambda value: value in (0, 1)),
+    ("header_settings", "key_column"): ("header_key_column", str, None),
+    ("header_settings", "scan_rows"): ("header_scan_rows", int, lambda value: value > 0),
+    ("header_settings", "total_markers"): ("header_total_markers", list, None),
+    ("dedup_settings", "enabled"): ("dedup_enabled", int, lambda value: value in (0, 1)),
+    ("dedup_settings", "key_columns"): ("dedup_key_columns", list, None),
+    ("summary_settings", "mode"): ("summary_mode", str, lambda value: value in ("detail", "summary", "both")),
+    ("summary_settings", "group_columns"): ("summary_group_columns", list, None),
+    ("summary_settings", "value_columns"): ("summary_value_columns", list, None),
+    ("reader_settings", "chunk_rows"): ("chunk_rows", int, lambda value: value >= 0),
+    ("reader_settings", "csv_sheet_name"): ("csv_sheet_name", str, lambda value: bool(value.strip())),
+    ("watch_settings", "interval"): ("watch_interval", float, lambda value: value > 0),
+    ("watch_settings", "debounce"): ("watch_debounce", float, lambda value: value >= 0),
+}
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Проверенные настройки приложения из config.json.
+    Объект неизменяемый и состоит из простых типов, поэтому его можно
+    передавать в рабочие процессы (pickle) без повторного чтения файла.
+    """
+    general_header: int = 0
+    header_auto_detect: int = 0
+    header_key_column: str = ""
+    header_scan_rows: int = 30
+    header_total_markers: Tuple[str, ...] = ("Итого", "Всего")
+    dedup_enabled: int = 0
+    dedup_key_columns: Tuple[str, ...] = ()
+    summary_mode: str = "detail"
+    summary_group_columns: Tuple[str, ...] = ()
+    summary_value_columns: Tuple[str, ...] = ()
+    chunk_rows: int = 0
+    csv_sheet_name: str = "CSV"
+    watch_interval: float = 2.0
+    watch_debounce: float = 3.0
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Settings":
+        """
+        Создает настройки из словаря config.json, проверяя значения по SETTINGS_SCHEMA.
+        Отсутствующие и некорректные значения заменяются значениями по умолчанию.
+        """
+        values = {}
+        for (section, key), (field_name, value_type, check) in SETTINGS_SCHEMA.items():
+            section_values = config.get(section, {})
+            if not isinstance(section_values, dict) or key not in section_values:
+                continue
+            value = section_values[key]
+            if value_type is int and isinstance(value, bool):
+                value = int(value)
+            if value_type is float and isinstance(value, int) and not isinstance(value, bool):
+                value = float(value)
+            if not isinstance(value, value_type) or (check is not None and not check(value)):
+                print(f"Некорректное значение {section}.{key} в конфигурации: {value!r}. Используется значение по умолчанию.")
+                continue
+            if value_type is list:
+                value = tuple(str(item) for item in value)
+            values[field_name] = value
+        return cls(**values)
+
+
+# Кэш настроек: путь к config.json -> (время изменения файла, настройки)
+_settings_cache: Dict[str, Tuple[float, Settings]] = {}
+
+
+def get_settings(config_path: str = None) -> Settings:
+    """
+    Возвращает настройки приложения.
+    Файл читается и проверяется только при первом обращении и после его изменения
+    (сравнивается время изменения файла), в остальных случаях возвращается кэш.
+    """
+    if config_path is None:
+        config_path = CONFIG_FILE_PATH
+    
+    try:
+        mtime = os.stat(config_path).st_mtime
+    except OSError:
+        mtime = None
+    
+    cached = _settings_cache.get(config_path)
+    if cached is not None and mtime is not None and cached[0] == mtime:
+        return cached[1]
+    
+    settings = Settings.from_config(read_config(config_path))
+    if mtime is None:
+        # read_config мог создать файл со значениями по умолчанию
+        try:
+            mtime = os.stat(config_path).st_mtime
+        except OSError:
+            return settings
+    _settings_cache[config_path] = (mtime, settings)
+    return settings
+
+@dataclass
+class SheetStats:
+    """
+    Статистика листа по всем файлам папки.
+    files — имена файлов, в которых есть лист;
+    rows — оценка суммарного количества строк (по метаданным листов);
+    rows_known — False, если хотя бы для одного файла оценку получить не удалось.
+    """
+    files: List[str] = field(default_factory=list)
+    rows: int = 0
+    rows_known: bool = True
+    
+    def add_file(self, file_name: str, rows: Optional[int]) -> None:
+        self.files.append(file_name)
+        if rows is None:
+            self.rows_known = False
+        else:
+            self.rows += rows
+
+
+class SheetIndex:
+    """
+    Индекс имен листов для окна выбора листов.
+    Имена отсортированы и приведены к нижнему регистру (casefold) один раз при создании,
+    поэтому фильтрация по вводу не требует повторной сортировки и преобразований.
+    """
+    
+    def __init__(self, sheet_stats: Dict[str, SheetStats], file_names: List[str]):
+        self.stats = sheet_stats
+        self.file_names = file_names
+        self.names = sorted(sheet_stats, key=str.casefold)
+        self._folded = [name.casefold() for name in self.names]
+    
+    def __len__(self) -> int:
+        return len(self.names)
+    
+    def filter(self, text: str) -> List[str]:
+        """Возвращает имена листов, содержащие text (без учета регистра), в порядке сортировки."""
+        needle = text.strip().casefold()
+        if not needle:
+            return self.names
+        return [name for name, folded in zip(self.names, self._folded) if needle in folded]
+    
+    def estimate_rows(self, sheet_names: List[str]) -> Tuple[int, bool]:
+        """
+        Оценка количества строк сводного файла для выбранных листов.
+        Возвращает (количество строк, признак того, что оценка полная).
+        """
+        selected = [self.stats[name] for name in sheet_names if name in self.stats]
+        return sum(stats.rows for stats in selected), all(stats.rows_known for stats in selected)
+    
+    def predict_missing_files(self, sheet_names: List[str]) -> Dict[str, List[str]]:
+        """
+        Файлы, в которых нет ни одного из выбранных листов (они будут пропущены при агрегации),
+        в формате отчета о пропущенных файлах: имя файла -> список отсутствующих листов.
+        """
+        covered = set()
+        for name in sheet_names:
+            if name in self.stats:
+                covered.update(self.stats[name].files)
+        return {file_name: list(sheet_names) for file_name in self.file_names if file_name not in covered}
+
 
 def select_folder(current_path: Path) -> Path:
     """
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Наблюдение за папкой и инкрементальное обновление сводного файла.
+"""
+
+import os
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aggregation import (get_excel_files,
+                         read_file,
+                         save_consolidated,
+                         AggregationPlan,
+                         FileResult,
+                         FileResultCollector,
+                         NoExcelFilesError)
+from utils import get_settings, Settings
+from data_text import (NAME_OUTPUT_FILE,
+                       TEXT_WATCH_STARTED,
+                       TEXT_WATCH_UPDATED,
+                       TEXT_WATCH_NO_DATA,
+                       TEXT_WATCH_ERROR,
+                       TEXT_WATCH_STOPPED)
+
+# Подпись файла: (время изменения в наносекундах, размер в байтах)
+FileSignature = Tuple[int, int]
+
+
+class FolderChanges(NamedTuple):
+    """Изменения в папке с момента последней сборки сводного файла."""
+    added: List[Path]
+    changed: List[Path]
+    removed: List[Path]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+def snapshot_folder(folder_path: Path, exclude: Optional[Path] = None) -> Dict[Path, FileSignature]:
+    """
+    Подписи всех обрабатываемых файлов папки (см. get_excel_files).
+    exclude — сводный файл: если он сохраняется в эту же папку, его изменения не учитываются.
+    """
+    try:
+        files = get_excel_files(folder_path, exclude)
+    except NoExcelFilesError:
+        return {}
+    snapshot: Dict[Path, FileSignature] = {}
+    for file_path in files:
+        try:
+            stat = file_path.stat()
+        except OSError:
+            continue  # Файл удален между чтением папки и stat
+        snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+class IncrementalAggregator:
+    """
+    Поддерживает сводный файл в актуальном состоянии при изменениях в папке.
+    Результаты чтения файлов хранятся между обновлениями: перечитываются только
+    добавленные и измененные файлы, данные удаленных файлов отбрасываются.
+    Сводный файл после этого сохраняется заново из сохраненных результатов.
+    """
+
+    def __init__(self,
+                 sheet_name_list: List[str],
+                 settings: Settings,
+                 output_path: str = NAME_OUTPUT_FILE):
+        self.sheet_name_list = sheet_name_list
+        self.settings = settings
+        self.output_path = output_path
+        self.snapshot: Dict[Path, FileSignature] = {}  # состояние папки на момент последнего сохранения
+        self._results: Dict[Path, Tuple[FileSignature, FileResult]] = {}
+
+    def diff(self, snapshot: Dict[Path, FileSignature]) -> FolderChanges:
+        """Сравнивает состояние папки с прочитанными файлами."""
+        return FolderChanges(
+            added=[path for path in snapshot if path not in self._results],
+            changed=[path for path, signature in snapshot.items()
+                     if path in self._results and self._results[path][0] != signature],
+            removed=[path for path in self._results if path not in snapshot])
+
+    def update(self,
+               snapshot: Dict[Path, FileSignature],
+               on_status: Callable[[str], None]) -> Tuple[FolderChanges, Dict[str, List[str]], bool]:
+        """
+        Перечитывает добавленные и измененные файлы и сохраняет сводный файл.
+        Если данных не осталось (файлы удалены или в них нет выбранных листов),
+        устаревший сводный файл удаляется, чтобы в нем не оставались строки удаленных файлов.
+        Возвращает изменения, словарь пропущенных файлов (как aggregating_data_from_excel_files)
+        и признак того, что сводный файл сохранен.
+        Ошибки сохранения пробрасываются; прочитанные файлы при этом остаются в кэше,
+        поэтому повторная попытка только сохраняет файл заново.
+        """
+        changes = self.diff(snapshot)
+        for path in changes.removed:
+            del self._results[path]
+        for path in changes.added + changes.changed:
+            self._results[path] = (snapshot[path], read_file(path, self.sheet_name_list, self.settings))
+
+        collector = FileResultCollector(AggregationPlan.from_settings(self.settings))
+        for path in snapshot:
+            collector.add(path, self._results[path][1])
+
+        if collector.has_data:
+            save_consolidated(collector.blocks, collector.summary_partials, self.settings, on_status,
+                              self.output_path, open_result=False)
+        elif os.path.exists(self.output_path):
+            os.remove(self.output_path)
+        self.snapshot = snapshot
+        return changes, collector.missing_files, collector.has_data
+
+
+def watch_folder(folder_path: Path,
+                 sheet_name_list: List[str],
+                 on_status: Callable[[str], None],
+                 stop_event: threading.Event,
+                 settings: Optional[Settings] = None,
+                 output_path: str = NAME_OUTPUT_FILE,
+                 on_update: Optional[Callable[[FolderChanges, Dict[str, List[str]]], None]] = None) -> None:
+    """
+    Наблюдает за папкой (опрос раз в settings.watch_interval секунд) до установки stop_event
+    и обновляет сводный файл при появлении, изменении или удалении файлов.
+
+    Пачка изменений обрабатывается, когда папка не менялась settings.watch_debounce секунд:
+    так копирование множества файлов вызывает одно обновление, а не обновление на каждый файл.
+    После каждого обновления вызывается on_update(изменения, пропущенные файлы).
+    """
+    if settings is None:
+        settings = get_settings()
+    aggregator = IncrementalAggregator(sheet_name_list, settings, output_path)
+    on_status(TEXT_WATCH_STARTED.format(folder=folder_path))
+
+    last_seen: Optional[Dict[Path, FileSignature]] = None
+    changed_at = 0.0
+    first_run = True
+    while first_run or not stop_event.wait(settings.watch_interval):
+        snapshot = snapshot_folder(folder_path, Path(output_path))
+        if not first_run:
+            if snapshot == aggregator.snapshot:
+                last_seen = None
+                continue
+            # Ждем, пока папка перестанет меняться
+            if snapshot != last_seen:
+                last_seen = snapshot
+                changed_at = time.monotonic()
+                continue
+            if time.monotonic() - changed_at < settings.watch_debounce:
+                continue
+        first_run = False
+
+        try:
+            changes, missing_files, saved = aggregator.update(snapshot, on_status)
+        except Exception as e:
+            on_status(TEXT_WATCH_ERROR.format(text_err=e))
+            continue
+        text_update = TEXT_WATCH_UPDATED if saved else TEXT_WATCH_NO_DATA
+        on_status(text_update.format(time=datetime.now().strftime('%H:%M:%S'),
+                                     added=len(changes.added),
+                                     changed=len(changes.changed),
+                                     removed=len(changes.removed)))
+        if on_update is not None:
+            on_update(changes, missing_files)
+
+    on_status(TEXT_WATCH_STOPPED)